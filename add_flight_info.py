@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 '''
-Given a travel itinerary in .yaml format, creates entries in a Google Calendar with departure and arrival times in local timezones.
+Given a travel itinerary in .yaml, .csv or .jsonl format, creates entries in a Google Calendar with departure and arrival times in local timezones.
 
 Uses Airport data file extracted from https://github.com/opentraveldata/opentraveldata
 
@@ -14,15 +14,15 @@ Source: https://github.com/Christophe-Gauge/Google-Calendar
 
 # I M P O R T S ###############################################################
 
-from dateutil import parser
+import asyncio
+import sys
 import yaml
-import pickle
-import os.path
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-import pytz
-from datetime import datetime, timedelta
+from calendar_service import get_service
+from calendar_batch import BatchWriter
+from airport_index import AirportIndex
+from event_index import EventIndex, flight_fingerprint, event_id
+from job_journal import JobJournal
+from itinerary import read_flights, normalize_legs, duration
 
 
 __author__ = "Christophe Gauge"
@@ -32,11 +32,6 @@ __license__ = "GNU General Public License v3.0"
 
 # G L O B A L S ###############################################################
 
-# If modifying these scopes, delete the file token.pickle.
-# SCOPES = ['https://www.googleapis.com/auth/calendar.readonly']
-SCOPES = ['https://www.googleapis.com/auth/calendar']
-
-
 my_flights = """
 - name: UA1813
   departure:
@@ -93,86 +88,91 @@ my_flights = """
   confirmation:
     ABCDEF 
 """
-flights = yaml.safe_load(my_flights)
 
-with open("airport_timezone.tsv") as file:
-    data = file.read()
-airports = {}
-for line in data.split('\n'):
-    if line != '':
-        iata_code, airport_name, timezone = line.split('\t')
-        airports[iata_code] = {"airport_name": airport_name, "timezone": timezone}
+use_async_client = False  # Insert the events concurrently with the asyncio client instead of HTTP batches
 
+airports = AirportIndex()  # Memory-mapped airport_timezone.idx, compiled from airport_timezone.tsv
 
-# F U N C T I O N S ###########################################################
 
+# F U N C T I O N S ###########################################################
 
-def main():
-  """Main function."""
-  creds = None
-  # The file token.pickle stores the user's access and refresh tokens, and is
-  # created automatically when the authorization flow completes for the first
-  # time.
-  if os.path.exists('token.pickle'):
-      with open('token.pickle', 'rb') as token:
-          creds = pickle.load(token)
-  # If there are no (valid) credentials available, let the user log in.
-  if not creds or not creds.valid:
-      if creds and creds.expired and creds.refresh_token:
-          creds.refresh(Request())
-      else:
-          flow = InstalledAppFlow.from_client_secrets_file(
-              'credentials.json', SCOPES)
-          creds = flow.run_local_server(port=0)
-      # Save the credentials for the next run
-      with open('token.pickle', 'wb') as token:
-          pickle.dump(creds, token)
-
-  service = build('calendar', 'v3', credentials=creds)
-
-  for flight in flights:
-      print(flight['name'])
-      print(flight['departure']['airport'], airports[flight['departure']['airport']])
-      print(flight['arrival']['airport'], airports[flight['arrival']['airport']])
-      flight_title = f"{flight['name']} - {flight['departure']['airport']} - {flight['arrival']['airport']}"
-      date1 = parser.parse(flight['departure']['time']).replace(tzinfo=pytz.timezone(airports[flight['departure']['airport']]['timezone']))
-      date2 = parser.parse(flight['arrival']['time']).replace(tzinfo=pytz.timezone(airports[flight['arrival']['airport']]['timezone']))
-      delta = date2 - date1
-      days, seconds = delta.days, delta.seconds
-      hours = days * 24 + seconds // 3600
-      minutes = (seconds % 3600) // 60
-  
-      print(f"The difference between {date1} and {date2} is {hours:.0f} hours {minutes:.0f} minutes.")
-      flight_description = f"Booking: {flight['confirmation']}\n{airports[flight['departure']['airport']]['airport_name']} ({flight['departure']['airport']}) - {airports[flight['arrival']['airport']]['airport_name']} ({flight['arrival']['airport']})\nDuration: {hours:.0f} hours {minutes:.0f} minutes."
-
-      my_event = {
-          'summary': flight_title,
-          'description': flight_description,
-          'start': {
-              'dateTime': parser.parse(flight['departure']['time']).isoformat(),
-              'timeZone': airports[flight['departure']['airport']]['timezone'],
-          },
-          'end': {
-              'dateTime': parser.parse(flight['arrival']['time']).isoformat(),
-              'timeZone': airports[flight['arrival']['airport']]['timezone'],
-          },
-          'reminders': {
-              'useDefault': False,
-              'overrides': [
-                  {'method': 'popup', 'minutes': 30},
-                  {'method': 'popup', 'minutes': 10},
-              ],
-          },
-      }
 
+def build_event(leg):
+  """Return the calendar event of a normalized itinerary Leg."""
+  hours, minutes = duration(leg)
+  print(f"The difference between {leg.departure} and {leg.arrival} is {hours:.0f} hours {minutes:.0f} minutes.")
+  flight_title = f"{leg.name} - {leg.origin} - {leg.destination}"
+  flight_description = f"Booking: {leg.confirmation}\n{leg.origin_airport.airport_name} ({leg.origin}) - {leg.destination_airport.airport_name} ({leg.destination})\nDuration: {hours:.0f} hours {minutes:.0f} minutes."
+
+  return {
+      'summary': flight_title,
+      'description': flight_description,
+      'start': {
+          'dateTime': leg.departure.replace(tzinfo=None).isoformat(),
+          'timeZone': leg.origin_airport.timezone,
+      },
+      'end': {
+          'dateTime': leg.arrival.replace(tzinfo=None).isoformat(),
+          'timeZone': leg.destination_airport.timezone,
+      },
+      'reminders': {
+          'useDefault': False,
+          'overrides': [
+              {'method': 'popup', 'minutes': 30},
+              {'method': 'popup', 'minutes': 10},
+          ],
+      },
+  }
+
+
+def pending_events(source, index, journal):
+  """Yield ((flight name, fingerprint), event) for the legs not created yet, journaling their insert."""
+  for leg in normalize_legs(source, airports):
+      print(leg.name)
+      fingerprint = flight_fingerprint(leg)
+      if index.get('primary', fingerprint):
+          print('  ---> Already have it')
+          continue
+      if journal.is_done((leg.name, fingerprint)):
+          # Created by an interrupted run, whose index was not saved
+          index.add('primary', fingerprint, journal.done[(leg.name, fingerprint)] or event_id(fingerprint))
+          print('  ---> Created by the interrupted run')
+          continue
+      print(leg.origin, leg.origin_airport)
+      print(leg.destination, leg.destination_airport)
+
+      my_event = build_event(leg)
+      my_event['id'] = event_id(fingerprint)  # Lets the server reject duplicates too
       print(my_event)
-      event = service.events().insert(calendarId='primary', body=my_event).execute()
-      print('Event created: %s' % (event.get('htmlLink')))
+      journal.plan((leg.name, fingerprint), 'insert')
+      yield (leg.name, fingerprint), my_event
+
+
+def main(filename=None):
+  """Main function."""
+  index = EventIndex()
+  journal = JobJournal('flights')
+
+  # Legs are streamed from the itinerary file and sent in batches (or concurrent chunks) as they
+  # come, so memory use stays flat whatever the size of the file
+  source = read_flights(filename) if filename else yaml.safe_load(my_flights)
+  if use_async_client:
+      from async_calendar import insert_all
+      asyncio.run(insert_all('primary', pending_events(source, index, journal),
+                             journal.recorder(index.recorder('primary')), before_send=journal.sync))
+  else:
+      writer = BatchWriter(get_service(), callback=journal.recorder(index.recorder('primary')),
+                           before_send=journal.sync)
+      for key, my_event in pending_events(source, index, journal):
+          writer.insert('primary', my_event, key=key)
+      writer.flush()
+  index.close()
+  journal.finish()
 
 
 ###############################################################################
 
 if __name__ == "__main__":
-    main()
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
 
 # E N D   O F   F I L E #######################################################
@@ -2,7 +2,11 @@
 # -*- coding: utf-8 -*-
 
 '''
-Takes a list of days in plaintext and converts them to full-day events in a Google Calendar.
+Creates full-day events in Google Calendars for the holidays of rule-based regional calendars.
+
+The holidays are expanded by holiday_rules.py (fixed dates, nth weekday of a month, Easter
+offsets, weekend holidays observed on a weekday) for any number of years and calendars in one
+pass, and the events are sent in HTTP batches of up to 50 inserts.
 
 Assumes that the Google Calendar libraries are installed and configured:
 pip3 install --upgrade google-api-python-client google-auth-httplib2 google-auth-oauthlib
@@ -14,15 +18,13 @@ Source: https://github.com/Christophe-Gauge/Google-Calendar
 
 from __future__ import print_function
 from __future__ import generators
-from pytz import timezone
-from dateutil.parser import parse as dtparse
-from datetime import datetime, timedelta
-from dateutil import parser
-import pickle
-import os.path
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
+from datetime import date, timedelta
+from calendar_service import get_service
+from calendar_batch import BatchWriter
+from reconcile import reconcile
+from event_index import EventIndex, holiday_fingerprint, event_id
+from job_journal import JobJournal
+from holiday_rules import expand_region
 from tzlocal import get_localzone
 
 
@@ -33,67 +35,36 @@ __license__ = "GNU General Public License v3.0"
 
 # G L O B A L S ###############################################################
 
-# If modifying these scopes, delete the file token.pickle.
-# SCOPES = ['https://www.googleapis.com/auth/calendar.readonly']
-SCOPES = ['https://www.googleapis.com/auth/calendar']
+timezone = None  # Timezone of the events, None for the system's
+
+# Compare with the holidays already in the calendar and only insert, update or delete the
+# differences, instead of skipping the holidays recorded in the local event index
+reconcile_with_calendar = False
 
-timezone = get_localzone()
-print(timezone)
+years = [2021]
 
-myYear = ' 2021'
-work_dates = """Friday, January 1
-Thursday, Dec. 31
-Monday, January 18
-Monday, February 15
-Monday, May 31
-Monday, July 5
-Monday, September 6
-Thursday, November 25
-Friday, November 26
-Thursday, December 23
-Friday, December 24
-Monday, December 27"""
+# Each calendar gets the holidays of a region of holiday_rules.rule_sets, summary can use {name}
+calendars = [
+    {'region': 'work', 'calendarId': 'primary', 'summary': 'Work Holiday'},
+    # {'region': 'US', 'calendarId': 'xxxxxxxx@group.calendar.google.com', 'summary': '{name}'},
+]
 
 
 # F U N C T I O N S ###########################################################
 
 
-def createAllDayEvent(summary, startDate):
-    # Refer to the Python quickstart on how to setup the environment:
-    # https://developers.google.com/calendar/quickstart/python
-    # Change the scope to 'https://www.googleapis.com/auth/calendar' and delete any
-    # stored credentials.
-
-    creds = None
-    # The file token.pickle stores the user's access and refresh tokens, and is
-    # created automatically when the authorization flow completes for the first
-    # time.
-    if os.path.exists('token.pickle'):
-        with open('token.pickle', 'rb') as token:
-            creds = pickle.load(token)
-    # If there are no (valid) credentials available, let the user log in.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(
-                'credentials.json', SCOPES)
-            creds = flow.run_local_server(port=0)
-        # Save the credentials for the next run
-        with open('token.pickle', 'wb') as token:
-            pickle.dump(creds, token)
-
-    service = build('calendar', 'v3', credentials=creds)
-
-    event = {
+def buildAllDayEvent(summary, startDate):
+    """All-day event on startDate (ISO format), the end date is exclusive."""
+    endDate = (date.fromisoformat(startDate) + timedelta(days=1)).isoformat()
+    return {
       'summary': summary,
       'start': {
         'date': startDate,
-        'timeZone': str(timezone),
+        'timeZone': str(timezone or get_localzone()),
       },
       'end': {
-        'date': startDate,
-        'timeZone': str(timezone),
+        'date': endDate,
+        'timeZone': str(timezone or get_localzone()),
       },
       'reminders': {
         'useDefault': False,
@@ -104,17 +75,69 @@ def createAllDayEvent(summary, startDate):
       },
     }
 
-    event = service.events().insert(calendarId='primary', body=event).execute()
-    print('Event created: %s' % (event.get('htmlLink')))
+
+def createAllDayEvent(writer, index, journal, summary, startDate, calendarId='primary'):
+    """Queue the creation of an all-day event, sent in batches by the writer."""
+    fingerprint = holiday_fingerprint(startDate, summary)
+    key = (calendarId, startDate, fingerprint)
+    if index.get(calendarId, fingerprint):
+        print('  ---> Already have it')
+        return
+    if journal.is_done(key):
+        # Created by an interrupted run, whose index was not saved
+        index.add(calendarId, fingerprint, journal.done[key] or event_id(fingerprint))
+        print('  ---> Created by the interrupted run')
+        return
+
+    event = buildAllDayEvent(summary, startDate)
+    event['id'] = event_id(fingerprint)  # Lets the server reject duplicates too
+    journal.plan(key, 'insert')
+    writer.insert(calendarId, event, key=key)
+
+
+def holidays():
+    """Yield (calendar, summary, holiday date in ISO format) for every calendar and year, one calendar after the other."""
+    for calendar in calendars:
+        for holiday in expand_region(calendar['region'], years):
+            yield calendar, calendar['summary'].format(name=holiday.name), holiday.date.isoformat()
+
+
+def reconcile_holidays():
+    """Make the holidays of each calendar and year match the rules exactly, in shared batches."""
+    service = get_service()
+    desired = {}
+    for calendar, summary, holiday in holidays():
+        scope = (calendar['calendarId'], f"{calendar['region']}-holidays-{holiday[:4]}")
+        desired.setdefault(scope, {})[holiday] = buildAllDayEvent(summary, holiday)
+    # Every requested year has a scope, so that the holidays of a year that no longer has any get deleted
+    for calendar in calendars:
+        for year in years:
+            desired.setdefault((calendar['calendarId'], f"{calendar['region']}-holidays-{year}"), {})
+    with BatchWriter(service, callback=holiday_reconciled) as writer:
+        for (calendarId, scope), events in desired.items():
+            reconcile(service, calendarId, scope, events, writer=writer)
+
+
+def holiday_reconciled(key, event, exception):
+    operation, holiday = key
+    if exception is not None:
+        print(f'{holiday}: ERROR {exception}')
+    else:
+        print(f'{holiday}: {operation} done')
 
 
 def main():
     """Main function."""
-    for myDate in work_dates.split('\n'):
-        if myDate.strip() != "":
-            holiday = parser.parse(myDate + myYear).date().isoformat()
-            print(holiday)
-            createAllDayEvent('Work Holiday', holiday)
+    print(timezone or get_localzone())
+    if reconcile_with_calendar:
+        reconcile_holidays()
+        return
+    # The journal lets an interrupted run resume, it is removed once every holiday is created
+    with JobJournal('holidays') as journal, EventIndex() as index, \
+            BatchWriter(get_service(), callback=journal.recorder(index.recorder()), before_send=journal.sync) as writer:
+        for calendar, summary, holiday in holidays():
+            print(holiday, summary)
+            createAllDayEvent(writer, index, journal, summary, holiday, calendarId=calendar['calendarId'])
 
 ###############################################################################
 
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Compact, memory-mapped lookup table of the world's airports, built from airport_timezone.tsv.
+
+The TSV file is compiled once into airport_timezone.idx, a binary file made of:
+- a header: magic number, number of airports and offset of the string table,
+- a sorted array of fixed-width records: the 3 letter IATA code followed by the offsets of the
+  airport name and of the timezone in the string table,
+- a string table of length-prefixed UTF-8 strings, where each timezone name is stored only once.
+
+Lookups memory-map the index and binary search the records, so nothing is parsed at startup.
+
+Source: https://github.com/Christophe-Gauge/Google-Calendar
+'''
+
+# I M P O R T S ###############################################################
+
+import mmap
+import os
+import os.path
+import struct
+from collections import namedtuple
+
+
+__author__ = "Christophe Gauge"
+__version__ = "1.0.1"
+__license__ = "GNU General Public License v3.0"
+
+
+# G L O B A L S ###############################################################
+
+tsv_file = 'airport_timezone.tsv'
+index_file = 'airport_timezone.idx'
+
+MAGIC = b'AIX1'
+header = struct.Struct('<4sII')  # magic, number of records, offset of the string table
+record = struct.Struct('<3sxII')  # IATA code, name offset, timezone offset
+string_length = struct.Struct('<H')
+
+Airport = namedtuple('Airport', ['airport_name', 'timezone'])
+
+
+# F U N C T I O N S ###########################################################
+
+
+def read_tsv(filename=tsv_file):
+    """Yield (iata_code, airport_name, timezone) from the TSV file, skipping its header row."""
+    with open(filename, encoding='utf-8') as f:
+        next(f, None)
+        for line in f:
+            line = line.rstrip('\n')
+            if line != '':
+                iata_code, airport_name, timezone = line.split('\t')
+                yield iata_code, airport_name, timezone
+
+
+def compile_index(rows, filename=index_file):
+    """Write the binary index for an iterable of (iata_code, airport_name, timezone) rows."""
+    airports = {}
+    for iata_code, airport_name, timezone in rows:
+        code = iata_code.encode('ascii', 'ignore')
+        if len(code) == 3:
+            airports[code] = (airport_name, timezone)
+
+    strings = bytearray()
+    interned = {}
+
+    def intern(text):
+        if text not in interned:
+            data = text.encode('utf-8')
+            interned[text] = len(strings)
+            strings.extend(string_length.pack(len(data)))
+            strings.extend(data)
+        return interned[text]
+
+    records = bytearray()
+    for code in sorted(airports):
+        airport_name, timezone = airports[code]
+        records.extend(record.pack(code, intern(airport_name), intern(timezone)))
+
+    tmp_file = filename + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        f.write(header.pack(MAGIC, len(airports), header.size + len(records)))
+        f.write(records)
+        f.write(strings)
+    os.replace(tmp_file, filename)
+    return len(airports)
+
+
+class AirportIndex(object):
+    """Read-only mapping of IATA code to Airport(airport_name, timezone).
+
+    The index is (re)compiled from the TSV file the first time it is used if it is missing or
+    older than the TSV file.
+    """
+
+    def __init__(self, filename=index_file, source=tsv_file):
+        self.filename = filename
+        self.source = source
+        self._map = None
+
+    def _open(self):
+        if not os.path.exists(self.filename) or \
+                (os.path.exists(self.source) and os.path.getmtime(self.source) > os.path.getmtime(self.filename)):
+            compile_index(read_tsv(self.source), self.filename)
+        with open(self.filename, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, self._strings = header.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{self.filename} is not an airport index')
+
+    def _string(self, offset):
+        offset += self._strings
+        (length,) = string_length.unpack_from(self._map, offset)
+        start = offset + string_length.size
+        return self._map[start:start + length].decode('utf-8')
+
+    def _find(self, iata_code):
+        if self._map is None:
+            self._open()
+        code = iata_code.upper().encode('ascii', 'ignore')
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            position = header.size + middle * record.size
+            current = self._map[position:position + 3]
+            if current < code:
+                low = middle + 1
+            elif current > code:
+                high = middle
+            else:
+                return position
+        return None
+
+    def get(self, iata_code, default=None):
+        position = self._find(iata_code)
+        if position is None:
+            return default
+        code, name_offset, timezone_offset = record.unpack_from(self._map, position)
+        return Airport(self._string(name_offset), self._string(timezone_offset))
+
+    def __getitem__(self, iata_code):
+        airport = self.get(iata_code)
+        if airport is None:
+            raise KeyError(iata_code)
+        return airport
+
+    def __contains__(self, iata_code):
+        return self._find(iata_code) is not None
+
+    def __len__(self):
+        if self._map is None:
+            self._open()
+        return self._count
+
+
+###############################################################################
+
+if __name__ == "__main__":
+    print(f'{compile_index(read_tsv())} airports written to {index_file}')
+
+# E N D   O F   F I L E #######################################################
@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+asyncio client for the Google Calendar v3 endpoints used by the scripts in this repository.
+
+Covers events list / insert / patch / update / delete and the HTTP batch endpoint, with the
+same request and response bodies as googleapiclient. Requests run over a pool of persistent
+HTTP/1.1 keep-alive connections, so thousands of operations can be in flight from one process.
+Errors are raised as googleapiclient HttpError, so the existing error handling applies.
+Every request takes its tokens from the shared rate_limit bucket, transient errors are retried
+with backoff, and an AIMDLimiter adapts the number of requests in flight. A connection lost
+after a request was sent is only retried for idempotent methods: an insert may have been
+processed, sending it again could create the event twice.
+
+The credentials are shared with calendar_service (and refreshed when about to expire). The
+client can be pointed at a local server with base_url, without credentials; by default it
+follows calendar_service.api_url (GCAL_API_URL).
+
+AsyncWriter has the interface of calendar_batch.BatchWriter (insert, patch, delete, flush and
+a callback per key), so a synchronous script can switch to this client without other changes.
+
+Source: https://github.com/Christophe-Gauge/Google-Calendar
+'''
+
+# I M P O R T S ###############################################################
+
+import asyncio
+import json
+import ssl
+import time
+import uuid
+from urllib.parse import quote, urlencode, urlsplit
+import httplib2
+from googleapiclient.errors import HttpError
+import metrics
+import rate_limit
+
+
+__author__ = "Christophe Gauge"
+__version__ = "1.0.1"
+__license__ = "GNU General Public License v3.0"
+
+
+# G L O B A L S ###############################################################
+
+google_url = 'https://www.googleapis.com'
+api_path = '/calendar/v3'
+batch_path = '/batch/calendar/v3'
+max_connections = 32
+
+
+# F U N C T I O N S ###########################################################
+
+
+class RequestInterrupted(ConnectionError):
+    """The connection failed after the request was sent, the server may have processed it."""
+
+
+async def read_response(reader, status_line=None):
+    """Read an HTTP/1.1 response, return (status, headers, body, keep_alive)."""
+    status_line = status_line or await reader.readline()
+    if not status_line.endswith(b'\n'):
+        raise ConnectionError('Connection closed by the server')
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        body = bytearray()
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                await reader.readline()
+                break
+            body.extend(await reader.readexactly(size))
+            await reader.readline()
+        body = bytes(body)
+    else:
+        body = await reader.readexactly(int(headers.get('content-length', 0)))
+    keep_alive = headers.get('connection', '').lower() != 'close'
+    return status, headers, body, keep_alive
+
+
+def http_error(status, headers, body, uri):
+    response = httplib2.Response(dict(headers, status=str(status)))
+    return HttpError(response, body, uri=uri)
+
+
+def parse_batch_response(content_type, body):
+    """Return {Content-ID: (status, headers, body)} of a multipart/mixed batch response."""
+    boundary = content_type.split('boundary=', 1)[1].strip('"')
+    results = {}
+    for part in body.split(b'--' + boundary.encode())[1:]:
+        if part.startswith(b'--'):
+            break
+        part_headers, _, http = part.strip(b'\r\n').partition(b'\r\n\r\n')
+        content_id = None
+        for line in part_headers.split(b'\r\n'):
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'content-id':
+                content_id = value.strip().strip('<>').replace('response-', '', 1)
+        head, _, content = http.partition(b'\r\n\r\n')
+        lines = head.split(b'\r\n')
+        status = int(lines[0].split()[1])
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        results[content_id] = (status, headers, content)
+    return results
+
+
+class AsyncCalendar(object):
+    """Calendar v3 client running on asyncio with pooled keep-alive connections.
+
+    Use as "async with AsyncCalendar() as calendar:". credentials defaults to the ones of
+    calendar_service, pass credentials=False to send unauthenticated requests (local server).
+    """
+
+    def __init__(self, credentials=None, base_url=None, max_connections=max_connections, limiter=None):
+        import calendar_service
+        if base_url is None:
+            base_url = calendar_service.api_url or google_url
+        if credentials is None:
+            credentials = False if calendar_service.api_url else calendar_service.get_credentials()
+        self.credentials = credentials or None
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.prefix = parts.path.rstrip('/')
+        self.limiter = limiter or rate_limit.AIMDLimiter(initial=8, maximum=max_connections)
+        self.max_connections = max_connections
+        self._idle = []
+        self._open = 0
+        self._in_flight = 0
+        self._slots = None
+        self._refresh_lock = None
+        self.requests_sent = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        while self._idle:
+            reader, writer = self._idle.pop()
+            writer.close()
+        self._open = 0
+
+    # Connections and authorization
+
+    async def _connect(self):
+        """Return (reader, writer, reused), reused for a pooled connection that was idle."""
+        if self._idle:
+            return self._idle.pop() + (True,)
+        context = ssl.create_default_context() if self.scheme == 'https' else None
+        reader, writer = await asyncio.open_connection(self.host, self.port, ssl=context)
+        self._open += 1
+        return reader, writer, False
+
+    async def _authorization(self):
+        if self.credentials is None:
+            return {}
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        from calendar_service import needs_refresh, refresh_credentials
+        if needs_refresh(self.credentials):
+            async with self._refresh_lock:
+                if needs_refresh(self.credentials):
+                    await asyncio.get_running_loop().run_in_executor(None, refresh_credentials, self.credentials)
+        return {'authorization': f'Bearer {self.credentials.token}'}
+
+    async def _acquire_slot(self):
+        """Wait until fewer requests than the adaptive limit are in flight."""
+        if self._slots is None:
+            self._slots = asyncio.Condition()
+        async with self._slots:
+            await self._slots.wait_for(lambda: self._in_flight < min(self.limiter.limit, self.max_connections))
+            self._in_flight += 1
+
+    async def _release_slot(self):
+        async with self._slots:
+            self._in_flight -= 1
+            self._slots.notify_all()
+
+    async def _send(self, method, path, body=b'', headers=None):
+        """Send one request on a pooled connection, return (status, headers, body)."""
+        request_headers = {'host': self.host, 'accept': 'application/json', 'content-length': str(len(body))}
+        request_headers.update(await self._authorization())
+        request_headers.update(headers or {})
+        head = f'{method} {self.prefix}{path} HTTP/1.1\r\n' + \
+            ''.join(f'{name}: {value}\r\n' for name, value in request_headers.items()) + '\r\n'
+        while True:
+            reader, writer, reused = await self._connect()
+            try:
+                writer.write(head.encode('latin-1') + body)
+                await writer.drain()
+                status_line = await reader.readline()
+            except ConnectionError:
+                status_line = b''
+            if not status_line:
+                writer.close()
+                self._open -= 1
+                # Not a byte of answer on a pooled connection: the server closed it while it was
+                # idle and never saw the request, try the next one (a new one once the pool is empty)
+                if reused:
+                    continue
+                raise RequestInterrupted(f'Connection closed before the response to {method} {path}')
+            try:
+                status, response_headers, content, keep_alive = await read_response(reader, status_line)
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                writer.close()
+                self._open -= 1
+                raise RequestInterrupted(f'Connection lost during the response to {method} {path}') from e
+            if keep_alive:
+                self._idle.append((reader, writer))
+            else:
+                writer.close()
+                self._open -= 1
+            self.requests_sent += 1
+            metrics.count('bytes.sent', len(head) + len(body))
+            metrics.count('bytes.received', len(content))
+            return status, response_headers, content
+
+    async def request(self, method, path, params=None, body=None, headers=None, cost=1):
+        """Send a JSON API request with quota, retries and adaptive concurrency, return the JSON response."""
+        path = api_path + path + ('?' + urlencode(params, doseq=True) if params else '')
+        data = json.dumps(body).encode('utf-8') if body is not None else b''
+        request_headers = dict(headers or {})
+        if body is not None:
+            request_headers['content-type'] = 'application/json'
+        return await self._request(method, path, data, request_headers, cost)
+
+    async def _request(self, method, path, data, headers, cost):
+        attempt = 0
+        while True:
+            await asyncio.sleep(rate_limit.bucket.delay(cost))
+            await self._acquire_slot()
+            metrics.count('api.calls', cost)
+            try:
+                with metrics.timer('api.async.batch' if path.startswith(batch_path) else f'api.async.{method}'):
+                    status, response_headers, content = await self._send(method, path, data, headers)
+                if status >= 300:
+                    raise http_error(status, response_headers, content, path)
+            except Exception as e:
+                if not rate_limit.is_retryable(e) or attempt >= rate_limit.max_retries:
+                    raise
+                # Sending an insert (or a batch) again could create it twice
+                if isinstance(e, RequestInterrupted) and method not in rate_limit.idempotent_methods:
+                    raise
+                if rate_limit.is_throttled(e):
+                    metrics.count('api.throttled')
+                    self.limiter.throttled()
+                metrics.count('api.retries')
+                attempt += 1
+                await asyncio.sleep(rate_limit.backoff(attempt, e))
+                continue
+            finally:
+                await self._release_slot()
+            self.limiter.success()
+            if response_headers.get('content-type', '').startswith('multipart/'):
+                return response_headers['content-type'], content
+            return json.loads(content) if content else {}
+
+    # Calendar events endpoints
+
+    @staticmethod
+    def events_path(calendarId, eventId=None):
+        path = f'/calendars/{quote(calendarId, safe="")}/events'
+        return path + f'/{quote(eventId, safe="")}' if eventId else path
+
+    async def list_events(self, calendarId, **params):
+        """Return one page of events.list, params as for googleapiclient (pageToken, syncToken...)."""
+        params = {name: str(value).lower() if isinstance(value, bool) else value
+                  for name, value in params.items() if value is not None}
+        return await self.request('GET', self.events_path(calendarId), params)
+
+    async def iter_events(self, calendarId, **params):
+        """Yield all the events of an events.list query, across pages."""
+        params.setdefault('maxResults', 2500)
+        while True:
+            page = await self.list_events(calendarId, **params)
+            for event in page.get('items', []):
+                yield event
+            params['pageToken'] = page.get('nextPageToken')
+            if not params['pageToken']:
+                break
+
+    async def insert_event(self, calendarId, body):
+        return await self.request('POST', self.events_path(calendarId), body=body)
+
+    async def patch_event(self, calendarId, eventId, body, etag=None):
+        headers = {'if-match': etag} if etag else None
+        return await self.request('PATCH', self.events_path(calendarId, eventId), body=body, headers=headers)
+
+    async def update_event(self, calendarId, eventId, body, etag=None):
+        headers = {'if-match': etag} if etag else None
+        return await self.request('PUT', self.events_path(calendarId, eventId), body=body, headers=headers)
+
+    async def delete_event(self, calendarId, eventId, etag=None):
+        headers = {'if-match': etag} if etag else None
+        return await self.request('DELETE', self.events_path(calendarId, eventId), headers=headers)
+
+    async def batch(self, requests):
+        """Send up to 50 requests in one HTTP batch.
+
+        requests is a list of (method, path, body, headers) with path relative to /calendar/v3,
+        e.g. events_path(calendarId). Returns a list of (response, HttpError or None) in the same
+        order, sub-request failures are not retried here.
+        """
+        boundary = 'batch_' + uuid.uuid4().hex
+        parts = []
+        for index, (method, path, body, headers) in enumerate(requests):
+            data = json.dumps(body) if body is not None else ''
+            lines = [f'{method} {self.prefix}{api_path}{path} HTTP/1.1', 'Content-Type: application/json']
+            lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+            parts.append(f'--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <item-{index}>\r\n\r\n' +
+                         '\r\n'.join(lines) + '\r\n\r\n' + data + '\r\n')
+        data = (''.join(parts) + f'--{boundary}--\r\n').encode('utf-8')
+        headers = {'content-type': f'multipart/mixed; boundary={boundary}'}
+        content_type, content = await self._request('POST', batch_path, data, headers, cost=len(requests))
+        responses = parse_batch_response(content_type, content)
+        results = []
+        for index, (method, path, body, headers) in enumerate(requests):
+            status, response_headers, content = responses.get(f'item-{index}', (500, {}, b''))
+            if status >= 300:
+                results.append((None, http_error(status, response_headers, content, path)))
+            else:
+                results.append((json.loads(content) if content else {}, None))
+        return results
+
+
+async def gather(coroutines):
+    """Run coroutines concurrently, return their results or exceptions in order."""
+    return await asyncio.gather(*coroutines, return_exceptions=True)
+
+
+async def insert_all(calendarId, keyed_events, callback, chunk_size=500, before_send=None, **client_kwargs):
+    """Insert (key, event) pairs concurrently, chunk_size at a time.
+
+    callback(key, response, exception) is called for each event, and before_send() before each
+    chunk, like with BatchWriter.
+    """
+    async with AsyncCalendar(**client_kwargs) as calendar:
+        chunk = []
+        for item in keyed_events:
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                if before_send is not None:
+                    before_send()
+                await _insert_chunk(calendar, calendarId, chunk, callback)
+                chunk = []
+        if chunk:
+            if before_send is not None:
+                before_send()
+            await _insert_chunk(calendar, calendarId, chunk, callback)
+
+
+async def _insert_chunk(calendar, calendarId, chunk, callback):
+    results = await gather(calendar.insert_event(calendarId, event) for key, event in chunk)
+    for (key, event), result in zip(chunk, results):
+        if isinstance(result, Exception):
+            callback(key, None, result)
+        else:
+            callback(key, result, None)
+
+
+class AsyncWriter(object):
+    """Queue Calendar requests like BatchWriter, and send them concurrently, chunk_size at a time.
+
+    Used from synchronous code: each chunk runs on a private event loop, which keeps the pooled
+    connections open until flush(). callback(key, response, exception) and before_send() are
+    called like with BatchWriter, max_per_second caps the average rate of the requests.
+    """
+
+    def __init__(self, callback=None, chunk_size=500, max_per_second=None, before_send=None, **client_kwargs):
+        self.callback = callback
+        self.chunk_size = chunk_size
+        self.max_per_second = max_per_second
+        self.before_send = before_send
+        self.client_kwargs = client_kwargs
+        self._next_send = 0.0
+        self._loop = None
+        self._calendar = None
+        self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, key, operation, *args):
+        """Queue a call of an AsyncCalendar method, sending a chunk as soon as enough calls are pending."""
+        self.pending.append((key, operation, args))
+        if len(self.pending) >= self.chunk_size:
+            self._send(self.pending)
+            self.pending = []
+
+    def insert(self, calendarId, body, key):
+        self.add(key, 'insert_event', calendarId, body)
+
+    def patch(self, calendarId, eventId, body, key, etag=None):
+        self.add(key, 'patch_event', calendarId, eventId, body, etag)
+
+    def delete(self, calendarId, eventId, key, etag=None):
+        self.add(key, 'delete_event', calendarId, eventId, etag)
+
+    def flush(self):
+        """Send all the requests still queued, then close the connections."""
+        if self.pending:
+            chunk, self.pending = self.pending, []
+            self._send(chunk)
+        if self._loop is not None:
+            self._loop.run_until_complete(self._calendar.close())
+            self._loop.close()
+            self._loop = self._calendar = None
+
+    def _send(self, chunk):
+        if self.before_send is not None:
+            self.before_send()
+        if self.max_per_second:
+            delay = self._next_send - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._next_send = time.monotonic() + len(chunk) / self.max_per_second
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._calendar = AsyncCalendar(**self.client_kwargs)
+        results = self._loop.run_until_complete(
+            gather(getattr(self._calendar, operation)(*args) for key, operation, args in chunk))
+        for (key, operation, args), result in zip(chunk, results):
+            if isinstance(result, Exception):
+                metrics.count('events.failed')
+                if self.callback is not None:
+                    self.callback(key, None, result)
+            else:
+                metrics.count('events.written')
+                if self.callback is not None:
+                    self.callback(key, result, None)
+
+
+# E N D   O F   F I L E #######################################################
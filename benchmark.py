@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Benchmark the scripts against fake_calendar_server.py, with calendars of 10k to 1M events.
+
+Every scenario runs the real script (main()) in a fresh process, in its own working directory,
+against a local server seeded with the requested number of events, and reports:
+wall time, throughput, API calls (by method), HTTP requests, bytes sent / received and the
+peak memory (max RSS) of the script process.
+
+The client side quota limits (rate_limit.bucket, max_patches_per_second) are lifted so that the
+numbers measure the scripts, use --latency and --error-rate to simulate a slow or throttling API.
+The iss scenarios only use the TLE and ephemeris files already cached by sky_data.py (--sky-data,
+the skyfield-data directory of the scripts by default, filled by a first ./gcal.py iss), a stale
+TLE file is still good enough to time the predictions. They are skipped when there is no cache.
+
+./benchmark.py --events 10000 100000 1000000 --json benchmark.json
+
+Source: https://github.com/Christophe-Gauge/Google-Calendar
+'''
+
+# I M P O R T S ###############################################################
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from fake_calendar_server import FakeCalendarServer
+
+
+__author__ = "Christophe Gauge"
+__version__ = "1.0.1"
+__license__ = "GNU General Public License v3.0"
+
+
+# G L O B A L S ###############################################################
+
+script_directory = os.path.dirname(os.path.abspath(__file__))
+event_counts = [10000]
+flight_legs = 1000
+airport_codes = ['ATL', 'CDG', 'DFW', 'DXB', 'FRA', 'HND', 'IAH', 'JFK', 'LAX', 'LHR', 'ORD', 'SIN', 'SYD', 'TPA']
+reminders = {'useDefault': False, 'overrides': [{'method': 'popup', 'minutes': 30}, {'method': 'popup', 'minutes': 5}]}
+
+sky_cache = os.path.join(script_directory, 'skyfield-data')  # TLE and ephemeris used by the iss scenarios
+
+# Scenarios run in this order, each in its own working directory except the incremental runs
+scenarios = ['reminders', 'reminders_incremental', 'flights', 'flights_async', 'holidays', 'iss', 'iss_incremental']
+
+
+# F U N C T I O N S ###########################################################
+
+
+def calendar_events(count, start=None):
+    """Yield count timed events spread over the coming year, half of them without our reminders."""
+    start = start or datetime.now(timezone.utc) + timedelta(days=1)
+    for number in range(count):
+        begin = start + timedelta(minutes=(number * 37) % (365 * 24 * 60))
+        event = {'summary': f'Event {number}',
+                 'start': {'dateTime': begin.isoformat()},
+                 'end': {'dateTime': (begin + timedelta(hours=1)).isoformat()}}
+        if number % 2:
+            event['reminders'] = reminders
+        yield event
+
+
+def write_flights(filename, count, prefix='BM'):
+    """Write a JSON Lines itinerary of count legs between well known airports."""
+    moment = datetime(2030, 1, 1, 8, 0)
+    random.seed(count)
+    with open(filename, 'w') as f:
+        for number in range(count):
+            origin, destination = random.sample(airport_codes, 2)
+            arrival = moment + timedelta(hours=random.randint(1, 14))
+            f.write(json.dumps({'name': f'{prefix}{number}', 'confirmation': 'BENCH',
+                                'departure_airport': origin, 'departure_time': moment.strftime('%a, %b %d, %Y %I:%M %p'),
+                                'arrival_airport': destination, 'arrival_time': arrival.strftime('%a, %b %d, %Y %I:%M %p')}) + '\n')
+            moment = arrival + timedelta(hours=3)
+
+
+def run_reminders(size):
+    import calendar_reminders
+    import event_mirror
+    calendar_reminders.max_patches_per_second = None
+    # Always ask for the changes, a recently synced mirror would otherwise not call the API at all
+    event_mirror.max_age = 0
+    calendar_reminders.main()
+    return size
+
+
+def run_flights(size, use_async_client=False):
+    import add_flight_info
+    from airport_index import AirportIndex
+    add_flight_info.airports = AirportIndex(os.path.join(script_directory, 'airport_timezone.idx'),
+                                            os.path.join(script_directory, 'airport_timezone.tsv'))
+    add_flight_info.use_async_client = use_async_client
+    # Different flight numbers so that both clients insert new events
+    write_flights('flights.jsonl', flight_legs, prefix='AS' if use_async_client else 'BM')
+    add_flight_info.main('flights.jsonl')
+    return flight_legs
+
+
+def run_holidays(size):
+    import add_work_holidays
+    add_work_holidays.reconcile_with_calendar = True
+    add_work_holidays.main()
+    return len(list(add_work_holidays.holidays()))
+
+
+def run_iss(size):
+    import event_mirror
+    import iss_visible
+    import sky_data
+    sky_data.data_directory = sky_cache
+    sky_data.tle_max_age_days = float('inf')
+    event_mirror.max_age = 0
+    # The first run creates the fly-overs and caches the sun table, the incremental one finds them
+    with event_mirror.EventMirror() as mirror:
+        iss_visible.update(mirror)
+    return iss_visible.number_of_days_to_process * len(iss_visible.observers) * len(iss_visible.satellites)
+
+
+runners = {
+    'reminders': run_reminders,
+    'reminders_incremental': run_reminders,
+    'flights': run_flights,
+    'flights_async': lambda size: run_flights(size, use_async_client=True),
+    'holidays': run_holidays,
+    'iss': run_iss,
+    'iss_incremental': run_iss,
+}
+
+
+def run_scenario(name, size, directory, legs, sky_directory, results):
+    """Child process: run one scenario quietly, report its time and peak memory."""
+    global flight_legs, sky_cache
+    flight_legs = legs
+    sky_cache = sky_directory
+    sys.path.insert(0, script_directory)
+    directory = os.path.join(directory, name.replace('_incremental', ''))
+    os.makedirs(directory, exist_ok=True)
+    os.chdir(directory)
+    import rate_limit
+    rate_limit.bucket = rate_limit.TokenBucket(1e9, 1e9)
+    started = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        items = runners[name](size)
+    seconds = time.perf_counter() - started
+    results.put({'seconds': seconds, 'items': items,
+                 'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024})
+
+
+def benchmark(server, name, size, directory, legs, sky_directory):
+    """Run a scenario in a fresh process and return its measurements."""
+    calls, stats = server.store.calls.copy(), server.stats.copy()
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=run_scenario, args=(name, size, directory, legs, sky_directory, results))
+    process.start()
+    result = results.get()
+    process.join()
+    api_calls = server.store.calls - calls
+    traffic = server.stats - stats
+    result.update({'scenario': name, 'events': size,
+                   'items_per_second': result['items'] / result['seconds'] if result['seconds'] else 0.0,
+                   'api_calls': sum(api_calls.values()), 'calls_by_method': dict(api_calls),
+                   'http_requests': traffic['http_requests'], 'throttled': traffic['throttled'],
+                   'bytes_sent': traffic['bytes_in'], 'bytes_received': traffic['bytes_out']})
+    return result
+
+
+def report(result):
+    print(f"{result['scenario']:<22} {result['events']:>9} {result['seconds']:>9.2f} {result['items_per_second']:>11.0f}"
+          f" {result['api_calls']:>9} {result['http_requests']:>8} {result['bytes_received'] / 1e6:>10.1f}"
+          f" {result['bytes_sent'] / 1e6:>8.1f} {result['peak_rss_mb']:>9.0f}")
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description='Benchmark the scripts against a local fake Calendar API')
+    parser.add_argument('--events', type=int, nargs='+', default=event_counts, help='Calendar sizes to test')
+    parser.add_argument('--legs', type=int, default=flight_legs, help='Number of legs in the flights itinerary')
+    parser.add_argument('--scenarios', nargs='+', default=scenarios, choices=scenarios)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to each HTTP request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Probability of a 429 answer per API call')
+    parser.add_argument('--sky-data', default=sky_cache, help='Directory of the cached TLE and ephemeris files')
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+    names = args.scenarios
+    if not os.path.exists(os.path.join(args.sky_data, 'stations.txt')):
+        names = [name for name in names if not name.startswith('iss')]
+        if names != args.scenarios:
+            print(f'No cached TLE file in {args.sky_data}, skipping the iss scenarios')
+
+    server = FakeCalendarServer(latency=args.latency, error_rate=args.error_rate).start()
+    os.environ['GCAL_API_URL'] = server.url
+    print(f'Fake Calendar API on {server.url}')
+    print(f"{'scenario':<22} {'events':>9} {'seconds':>9} {'items/s':>11} {'api calls':>9} {'http':>8}"
+          f" {'MB recv':>10} {'MB sent':>8} {'peak MB':>9}")
+    results = []
+    for size in args.events:
+        server.store.calendars.clear()
+        server.store.seed('primary', calendar_events(size))
+        with tempfile.TemporaryDirectory(prefix='gcal-benchmark-') as directory:
+            for name in names:
+                result = benchmark(server, name, size, directory, args.legs, os.path.abspath(args.sky_data))
+                report(result)
+                results.append(result)
+    server.stop()
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+###############################################################################
+
+if __name__ == "__main__":
+    main()
+
+# E N D   O F   F I L E #######################################################
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Batching writer for the Google Calendar API.
+
+Groups individual requests (events insert, patch, delete...) into HTTP batch requests of up to
+batch_size sub-requests, links every response back to the key of the row it came from, and
+only retries the sub-requests that failed with a transient error. A batch lost on the way is
+not sent again (its inserts may have been processed), its requests are reported as failed.
+
+Assumes that the Google Calendar libraries are installed and configured:
+pip3 install --upgrade google-api-python-client google-auth-httplib2 google-auth-oauthlib
+
+Source: https://github.com/Christophe-Gauge/Google-Calendar
+'''
+
+# I M P O R T S ###############################################################
+
+import time
+import metrics
+from rate_limit import backoff, execute, is_retryable
+
+
+__author__ = "Christophe Gauge"
+__version__ = "1.0.1"
+__license__ = "GNU General Public License v3.0"
+
+
+# G L O B A L S ###############################################################
+
+max_batch_size = 50  # The Calendar API documents 50 calls per batch request
+
+
+# F U N C T I O N S ###########################################################
+
+
+class BatchWriter(object):
+    """Queue Calendar requests and send them in batches.
+
+    callback(key, response, exception) is called once per queued request, with the key that was
+    given to add() (flight, holiday date, ISS pass...), after retries have been exhausted.
+    Responses are not kept, so memory does not grow with the job. before_send() is called
+    before each batch goes out, e.g. to make a job journal durable.
+    """
+
+    def __init__(self, service, callback=None, batch_size=max_batch_size, max_retries=5, max_per_second=None,
+                 before_send=None):
+        self.service = service
+        self.callback = callback
+        self.before_send = before_send
+        self.batch_size = min(batch_size, max_batch_size)
+        self.max_retries = max_retries
+        self.max_per_second = max_per_second  # Optional cap on the number of sub-requests sent per second
+        self._next_send = 0.0
+        self.pending = []
+        self.batches_sent = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, request, key):
+        """Queue an HttpRequest, sending a batch as soon as enough requests are pending."""
+        self.pending.append((key, request))
+        if len(self.pending) >= self.batch_size:
+            self._send(self.pending)
+            self.pending = []
+
+    def insert(self, calendarId, body, key):
+        self.add(self.service.events().insert(calendarId=calendarId, body=body), key)
+
+    def patch(self, calendarId, eventId, body, key, etag=None):
+        """Queue a partial update, conditional on the event still having the given etag."""
+        request = self.service.events().patch(calendarId=calendarId, eventId=eventId, body=body)
+        if etag:
+            # The server answers 412 instead of overwriting an event modified in the meantime
+            request.headers['If-Match'] = etag
+        self.add(request, key)
+
+    def delete(self, calendarId, eventId, key, etag=None):
+        """Queue the deletion of an event, conditional on its etag if given."""
+        request = self.service.events().delete(calendarId=calendarId, eventId=eventId)
+        if etag:
+            request.headers['If-Match'] = etag
+        self.add(request, key)
+
+    def flush(self):
+        """Send all the requests still queued."""
+        while self.pending:
+            chunk, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+            self._send(chunk)
+
+    def _send(self, items):
+        if self.before_send is not None:
+            self.before_send()
+        attempt = 0
+        while items:
+            failed = self._execute_batch(items)
+            if not failed:
+                return
+            attempt += 1
+            if attempt > self.max_retries:
+                for key, request, exception in failed:
+                    self._done(key, None, exception)
+                return
+            # Exponential backoff with jitter before retrying only what failed
+            metrics.count('api.retries', len(failed))
+            time.sleep(backoff(attempt, failed[0][2]))
+            items = [(key, request) for key, request, exception in failed]
+
+    def _execute_batch(self, items):
+        """Send one batch request, return the (key, request, exception) of retryable failures."""
+        failed = []
+        by_id = {}
+        if self.max_per_second:
+            delay = self._next_send - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._next_send = time.monotonic() + len(items) / self.max_per_second
+
+        def handle(request_id, response, exception):
+            key, request = by_id[request_id]
+            if exception is not None and is_retryable(exception):
+                failed.append((key, request, exception))
+            else:
+                self._done(key, response, exception)
+
+        batch = self.service.new_batch_http_request(callback=handle)
+        for index, (key, request) in enumerate(items):
+            request_id = str(index)
+            by_id[request_id] = (key, request)
+            batch.add(request, request_id=request_id)
+        # Each call of the batch counts against the quota
+        try:
+            execute(batch, cost=len(items))
+        except (ConnectionError, TimeoutError) as e:
+            # The server may have processed the batch, sending it again could create events twice
+            for key, request in items:
+                self._done(key, None, e)
+            return failed
+        self.batches_sent += 1
+        return failed
+
+    def _done(self, key, response, exception):
+        if exception is None:
+            metrics.count('events.written')
+        else:
+            metrics.count('events.failed')
+        if self.callback is not None:
+            self.callback(key, response, exception)
+
+
+# E N D   O F   F I L E #######################################################
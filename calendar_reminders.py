@@ -2,7 +2,15 @@
 # -*- coding: utf-8 -*-
 
 '''
-For each event in your Google Calendar ensures that popup reminders are set.
+For each event in your Google Calendar ensures that the reminders asked by the reminder policy are set.
+
+The policy is an ordered list of rules (see reminder_policy.py), by calendar, summary pattern,
+duration and number of attendees, for timed and all-day events. It is read from policy_file if
+that file exists, otherwise the rules below are used, and it is compiled once per run.
+
+In sync mode the calendars are mirrored locally by event_mirror.py: the changes since the last
+run are synced (or nothing at all if the mirror is fresh enough), and every upcoming event of
+the mirror is checked against the policy.
 
 Assumes that the Google Calendar libraries are installed and configured:
 pip3 install --upgrade google-api-python-client google-auth-httplib2 google-auth-oauthlib
@@ -14,15 +22,15 @@ Source: https://github.com/Christophe-Gauge/Google-Calendar
 
 from __future__ import print_function
 from __future__ import generators
-import pickle
-import os.path
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from dateutil import tz
+from calendar_service import get_service
+from calendar_batch import BatchWriter
+from rate_limit import execute
+from event_mirror import EventMirror
+from reminder_policy import Policy, load_rules
+from job_journal import JobJournal
 from dateutil.parser import parse as dtparse
-from pytz import timezone
-from datetime import datetime, timedelta
+import os.path
+from datetime import datetime
 from tzlocal import get_localzone
 
 
@@ -34,44 +42,26 @@ __license__ = "GNU General Public License v3.0"
 # G L O B A L S ###############################################################
 
 
-# SCOPES = ['https://www.googleapis.com/auth/calendar.readonly']
-SCOPES = ['https://www.googleapis.com/auth/calendar']
-
-calendars = ['primary']
-reminders = {'useDefault': False, 'overrides': [{'method': 'popup', 'minutes': 30}, {'method': 'popup', 'minutes': 5}]}
-number_of_calendar_events = 20  # Retrieve x number of calendar entries
+calendars = {'primary': None}  # Calendars to process, their sync tokens are kept in event_mirror.sqlite
+sync_mode = True  # Mirror the whole calendar once, then only fetch the events that changed
+policy_file = 'reminder_policy.yaml'  # Rules used instead of the ones below when this file exists
+# First match wins, events matching no rule are left alone
+rules = [
+    # {'name': 'Holidays', 'all_day': True, 'summary': '(?i)holiday', 'reminders': [{'method': 'popup', 'minutes': 15 * 60}]},
+    # {'name': 'Meetings', 'all_day': False, 'min_attendees': 2, 'reminders': [{'method': 'popup', 'minutes': 10}]},
+    {'name': 'Timed events', 'all_day': False,
+     'reminders': [{'method': 'popup', 'minutes': 30}, {'method': 'popup', 'minutes': 5}]},
+]
+number_of_calendar_events = 20  # Retrieve x number of calendar entries when sync_mode is off
+max_patches_per_second = 10  # Rate limit for the reminder fixes, sent in batches
+use_async_client = False  # Send the reminder fixes concurrently with the asyncio client instead of HTTP batches
 
-timezone = get_localzone()
-print(timezone)
+timezone = None  # Timezone of the printed event times, None for the system's
 
 
 # F U N C T I O N S ###########################################################
 
 
-def get_service():
-    creds = None
-    # The file token.pickle stores the user's access and refresh tokens, and is
-    # created automatically when the authorization flow completes for the first
-    # time.
-    if os.path.exists('token.pickle'):
-        with open('token.pickle', 'rb') as token:
-            creds = pickle.load(token)
-    # If there are no (valid) credentials available, let the user log in.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(
-                'credentials.json', SCOPES)
-            creds = flow.run_local_server(port=0)
-        # Save the credentials for the next run
-        with open('token.pickle', 'wb') as token:
-            pickle.dump(creds, token)
-
-    service = build('calendar', 'v3', credentials=creds)
-    return service
-
-
 def get(service, calendarId):
     """Shows basic usage of the Google Calendar API.
     Prints the start and name of the next 10 events on the user's calendar.
@@ -79,35 +69,87 @@ def get(service, calendarId):
     # Call the Calendar API
     now = datetime.utcnow().isoformat() + 'Z'  # 'Z' indicates UTC time
     print(f'Getting the upcoming {number_of_calendar_events} events')
-    events_result = service.events().list(calendarId=calendarId, timeMin=now,
-                                        maxResults=number_of_calendar_events, singleEvents=True,
-                                        orderBy='startTime').execute()
+    events_result = execute(service.events().list(calendarId=calendarId, timeMin=now,
+                                                  maxResults=number_of_calendar_events, singleEvents=True,
+                                                  orderBy='startTime'))
     events = events_result.get('items', [])
     return events
 
 
+def get_upcoming(service, mirror, calendarId):
+    """Sync the mirror of a calendar, then return its upcoming events."""
+    if mirror.sync_state(calendarId)[0] is None:
+        print(f'Full sync of calendar {calendarId}')
+    changes = mirror.sync(service, calendarId)
+    print(f'{calendarId}: {changes} changes since the last sync')
+    return mirror.upcoming(calendarId)
+
+
+def load_policy():
+    """Compile the rules of policy_file, or the rules global if there is no such file."""
+    if policy_file and os.path.exists(policy_file):
+        print(f'Reminder rules from {policy_file}')
+        return Policy(load_rules(policy_file))
+    return Policy(rules)
+
+
+def reminders_fixed(key, event, exception):
+    calendarId, event_id = key
+    if exception is not None:
+        # 412 means the event was modified since we read it, the next run will look at it again
+        print(f'{event_id}: ERROR {exception}')
+    else:
+        print(f'{event_id}: Reminders updated')
+
+
+def fix_reminders(writer, policy, calendarId, events, local_zone, journal=None):
+    """Queue a reminders patch for each of the events that the policy says is missing some.
+
+    With a journal, the events already patched by an interrupted run are skipped.
+    """
+    for event in events:
+        target = policy.reminders_for(calendarId, event)
+        if target is None:
+            continue
+        if journal is not None and journal.is_done((calendarId, event['id'])):
+            continue
+        # All-day events have a date, not a dateTime
+        start = event['start'].get('dateTime', event['start'].get('date'))
+        print(event.get('summary'))
+        print(dtparse(start).astimezone(local_zone) if 'dateTime' in event['start'] else start)
+        print('**** ', event.get('reminders'))
+        # Only send the reminders, and only if nobody changed the event in the meantime
+        if journal is not None:
+            journal.plan((calendarId, event['id']), 'patch')
+        writer.patch(calendarId, event['id'], {'reminders': target}, key=(calendarId, event['id']),
+                     etag=event.get('etag'))
+        print('-'*20)
+
+
 def main():
+    local_zone = timezone or get_localzone()
+    print(local_zone)
+    policy = load_policy()
     service = get_service()
+    mirror = EventMirror() if sync_mode else None
+    # Only an interrupted run is resumed, a completed one drops what it did
+    journal = JobJournal('reminders', recurring=True)
+    # The mirror also records the reminders we fix, so they are not looked at again
+    callback = mirror.recorder(reminders_fixed) if mirror else reminders_fixed
+    if use_async_client:
+        from async_calendar import AsyncWriter
+        writer = AsyncWriter(callback=journal.recorder(callback), max_per_second=max_patches_per_second,
+                             before_send=journal.sync)
+    else:
+        writer = BatchWriter(service, callback=journal.recorder(callback), max_per_second=max_patches_per_second,
+                             before_send=journal.sync)
     for calendar in calendars:
-        myEvents = get(service, calendar)
-        for event in myEvents:
-            # All-day events have a date, not a dateTime
-            if 'dateTime' in event['start']:
-                start = event['start'].get('dateTime', event['start'].get('date'))
-                start_date = dtparse(start).astimezone(timezone)
-                print(event['summary'])
-                print(start_date)
-                if event['reminders']['useDefault'] is False \
-                        and 'overrides' in event['reminders'] \
-                        and {'method': 'popup', 'minutes': 5} in event['reminders']['overrides'] \
-                        and {'method': 'popup', 'minutes': 30} in event['reminders']['overrides']:
-                    pass
-                else:
-                    print('**** ', event['reminders'])
-                    event['reminders'] = reminders
-                    updated_event = service.events().update(calendarId=calendar, eventId=event['id'], body=event).execute()
-
-                print('-'*20)
+        myEvents = get_upcoming(service, mirror, calendar) if sync_mode else get(service, calendar)
+        fix_reminders(writer, policy, calendar, myEvents, local_zone, journal=journal)
+    writer.flush()
+    if mirror is not None:
+        mirror.close()
+    journal.finish()
 
 
 ###############################################################################
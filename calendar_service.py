@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Shared Google Calendar service factory used by all the scripts in this repository.
+
+Credentials are unpickled from token.pickle once per process and only refreshed when they are
+about to expire. The Calendar v3 discovery document is cached on disk so that building the
+service does not need to fetch or locate it again, and the resulting service object is reused
+for every API call made by the process.
+
+Set the GCAL_API_URL environment variable (e.g. http://127.0.0.1:8080) to send every call to
+a local server such as fake_calendar_server.py instead, without credentials.
+
+Assumes that the Google Calendar libraries are installed and configured:
+pip3 install --upgrade google-api-python-client google-auth-httplib2 google-auth-oauthlib
+
+Source: https://github.com/Christophe-Gauge/Google-Calendar
+'''
+
+# I M P O R T S ###############################################################
+
+import httplib2
+import json
+import os.path
+import pickle
+from datetime import datetime, timedelta
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.http import DEFAULT_HTTP_TIMEOUT_SEC
+import metrics
+
+
+__author__ = "Christophe Gauge"
+__version__ = "1.0.1"
+__license__ = "GNU General Public License v3.0"
+
+
+# G L O B A L S ###############################################################
+
+# If modifying these scopes, delete the file token.pickle.
+# SCOPES = ['https://www.googleapis.com/auth/calendar.readonly']
+SCOPES = ['https://www.googleapis.com/auth/calendar']
+
+token_file = 'token.pickle'
+credentials_file = 'credentials.json'
+discovery_file = 'calendar.v3.discovery.json'
+refresh_margin = timedelta(minutes=5)  # Refresh the access token when it expires in less than this
+api_url = os.environ.get('GCAL_API_URL')  # Local API server, e.g. fake_calendar_server.py
+
+_creds = None
+_service = None
+
+
+# F U N C T I O N S ###########################################################
+
+
+def save_credentials(creds):
+    """Save the credentials for the next run."""
+    with open(token_file, 'wb') as token:
+        pickle.dump(creds, token)
+
+
+def needs_refresh(creds):
+    """True if the access token is missing, expired or about to expire."""
+    if not creds.token or creds.expiry is None:
+        return not creds.valid
+    # google-auth stores the expiry as a naive UTC datetime
+    return creds.expiry - datetime.utcnow() < refresh_margin
+
+
+def refresh_credentials(creds):
+    """Get a new access token, the transport (and requests) is only imported when needed."""
+    from google.auth.transport.requests import Request
+    creds.refresh(Request())
+
+
+def get_credentials():
+    """Return the user's credentials, loading them from token.pickle only once per process."""
+    global _creds
+    if _creds is not None:
+        if needs_refresh(_creds) and _creds.refresh_token:
+            with metrics.timer('credentials.refresh'):
+                refresh_credentials(_creds)
+            save_credentials(_creds)
+        return _creds
+
+    creds = None
+    # The file token.pickle stores the user's access and refresh tokens, and is
+    # created automatically when the authorization flow completes for the first
+    # time.
+    if os.path.exists(token_file):
+        with metrics.timer('credentials.load'), open(token_file, 'rb') as token:
+            creds = pickle.load(token)
+    # If there are no (valid) credentials available, let the user log in.
+    if not creds or needs_refresh(creds):
+        if creds and creds.refresh_token:
+            with metrics.timer('credentials.refresh'):
+                refresh_credentials(creds)
+        else:
+            # Only needed the first time, the OAuth flow libraries are slow to import
+            from google_auth_oauthlib.flow import InstalledAppFlow
+            flow = InstalledAppFlow.from_client_secrets_file(credentials_file, SCOPES)
+            creds = flow.run_local_server(port=0)
+        save_credentials(creds)
+    _creds = creds
+    return _creds
+
+
+def get_discovery_document():
+    """Return the Calendar v3 discovery document, cached in discovery_file."""
+    if os.path.exists(discovery_file):
+        with open(discovery_file) as f:
+            return f.read()
+    # Let googleapiclient locate the document once (static copy or download), then keep it
+    with metrics.timer('discovery'):
+        service = build('calendar', 'v3', http=_NoHttp(), cache_discovery=False)
+    document = json.dumps(service._rootDesc)
+    tmp_file = discovery_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        f.write(document)
+    os.replace(tmp_file, discovery_file)
+    return document
+
+
+def get_service():
+    """Return the authorized Calendar service, built once per process."""
+    global _service
+    if _service is None and api_url:
+        # Requests and batches are both addressed relative to rootUrl
+        document = json.loads(get_discovery_document())
+        document['rootUrl'] = api_url.rstrip('/') + '/'
+        with metrics.timer('service.build'):
+            _service = build_from_document(document, http=_CountingHttp() if metrics.enabled else httplib2.Http())
+    elif _service is None and metrics.enabled:
+        document, creds = get_discovery_document(), get_credentials()
+        from google_auth_httplib2 import AuthorizedHttp
+        with metrics.timer('service.build'):
+            _service = build_from_document(document, http=AuthorizedHttp(creds, http=_CountingHttp()))
+    elif _service is None:
+        document, creds = get_discovery_document(), get_credentials()
+        with metrics.timer('service.build'):
+            _service = build_from_document(document, credentials=creds)
+    elif not api_url:
+        # Cheap check, only hits the network when the token is about to expire
+        get_credentials()
+    return _service
+
+
+class _CountingHttp(httplib2.Http):
+    """httplib2 transport counting the bytes sent and received, used when metrics are enabled."""
+
+    def __init__(self):
+        httplib2.Http.__init__(self, timeout=DEFAULT_HTTP_TIMEOUT_SEC)
+
+    def request(self, uri, method='GET', body=None, headers=None, *args, **kwargs):
+        response, content = httplib2.Http.request(self, uri, method, body, headers, *args, **kwargs)
+        metrics.count('bytes.sent', len(uri) + len(body or b''))
+        metrics.count('bytes.received', len(content or b''))
+        return response, content
+
+
+class _NoHttp(object):
+    """Placeholder transport, the service built with it is only used to read its discovery document."""
+
+    def request(self, *args, **kwargs):
+        raise RuntimeError('Discovery-only service cannot make requests')
+
+
+# E N D   O F   F I L E #######################################################
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Paginated and incremental reads of Google Calendar events.
+
+list_events() follows nextPageToken through the whole result set. sync_events() does a full
+sync the first time and then uses the stored nextSyncToken so that later runs only receive the
+events that changed (including deleted ones, with status 'cancelled').
+The sync tokens are stored by the caller, event_mirror.py keeps them with its copy of each calendar.
+
+Assumes that the Google Calendar libraries are installed and configured:
+pip3 install --upgrade google-api-python-client google-auth-httplib2 google-auth-oauthlib
+
+Source: https://github.com/Christophe-Gauge/Google-Calendar
+'''
+
+# I M P O R T S ###############################################################
+
+from googleapiclient.errors import HttpError
+import metrics
+from rate_limit import execute
+
+
+__author__ = "Christophe Gauge"
+__version__ = "1.0.1"
+__license__ = "GNU General Public License v3.0"
+
+
+# G L O B A L S ###############################################################
+
+page_size = 2500  # Largest page the Calendar API accepts for events.list
+
+
+# F U N C T I O N S ###########################################################
+
+
+def list_pages(service, calendarId, **kwargs):
+    """Yield every page of an events.list call, following nextPageToken."""
+    kwargs.setdefault('maxResults', page_size)
+    page_token = None
+    while True:
+        page = execute(service.events().list(calendarId=calendarId, pageToken=page_token, **kwargs))
+        metrics.count('events.read', len(page.get('items', [])))
+        yield page
+        page_token = page.get('nextPageToken')
+        if not page_token:
+            break
+
+
+def list_events(service, calendarId, **kwargs):
+    """Yield all the events matching an events.list query, across pages."""
+    for page in list_pages(service, calendarId, **kwargs):
+        for event in page.get('items', []):
+            yield event
+
+
+def sync_events(service, calendars, calendarId, on_reset=None, **kwargs):
+    """Yield the events of calendarId that changed since the last sync.
+
+    calendars maps each calendarId to its last nextSyncToken (None for a full sync) and is
+    updated with the new token once every page has been read. kwargs must not contain
+    parameters that cannot be combined with syncToken (timeMin, q, orderBy...).
+    on_reset is called when the server rejects the token, before the full sync starts, so that
+    a local copy of the calendar can be dropped.
+    """
+    kwargs.setdefault('singleEvents', True)
+    sync_token = calendars.get(calendarId)
+    try:
+        pages = list_pages(service, calendarId, syncToken=sync_token, **kwargs) if sync_token \
+            else list_pages(service, calendarId, **kwargs)
+        page = None
+        for page in pages:
+            for event in page.get('items', []):
+                yield event
+    except HttpError as e:
+        if e.resp.status != 410 or not sync_token:
+            raise
+        # The sync token expired, the server asks for a new full sync
+        print(f'Sync token for {calendarId} is no longer valid, doing a full sync')
+        calendars[calendarId] = None
+        if on_reset is not None:
+            on_reset()
+        for event in sync_events(service, calendars, calendarId, **kwargs):
+            yield event
+        return
+    if page is not None:
+        calendars[calendarId] = page.get('nextSyncToken')
+
+
+# E N D   O F   F I L E #######################################################
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Long-running service mode: fix the reminders as soon as the calendars change, instead of polling.
+
+An events.watch channel is opened for each calendar of calendar_reminders.calendars, and Google
+posts a notification to webhook_url whenever one of them changes. Each notification (a few
+arriving together are handled at once) triggers an incremental sync of the event mirror, and
+the reminder policy is applied to the events that changed. The ISS fly-overs are updated every
+iss_interval seconds. The credentials, HTTP connections, compiled policy, mirror, skyfield data
+and timezones stay loaded between runs, and channels are renewed before they expire. A step
+that fails (API errors once retries are exhausted, network down, TLE download...) is logged,
+counted in the metrics and tried again after a backoff, the service keeps running; a failed
+reminders update is followed by a full pass over the upcoming events, so no change is missed.
+
+Google only posts to a public HTTPS address: webhook_url is that address, forwarded (e.g. by a
+reverse proxy) to the local endpoint on listen_host:listen_port. Without webhook_url the local
+endpoint itself is registered, which is what fake_calendar_server.py needs to play the part of
+Google's notification sender:
+./fake_calendar_server.py --port 8080 &
+GCAL_API_URL=http://127.0.0.1:8080 ./calendar_watch.py
+
+Source: https://github.com/Christophe-Gauge/Google-Calendar
+'''
+
+# I M P O R T S ###############################################################
+
+import json
+import os
+import queue
+import secrets
+import signal
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from googleapiclient.errors import HttpError
+from tzlocal import get_localzone
+import calendar_reminders
+import metrics
+from calendar_batch import BatchWriter
+from calendar_service import get_service
+from event_mirror import EventMirror, timestamp
+from rate_limit import backoff, execute
+
+
+__author__ = "Christophe Gauge"
+__version__ = "1.0.1"
+__license__ = "GNU General Public License v3.0"
+
+
+# G L O B A L S ###############################################################
+
+webhook_url = None  # Public HTTPS address forwarded to the local endpoint, None to register the local endpoint
+listen_host = '127.0.0.1'
+listen_port = 8765
+notification_path = '/notifications'
+channel_ttl = 7 * 24 * 3600  # Seconds asked for each channel, Google may grant less
+renew_margin = 3600  # Renew a channel this many seconds before it expires
+settle_time = 2.0  # Seconds to wait after a notification for the next ones, handled together
+iss_interval = 12 * 3600  # Seconds between fly-over updates, None to leave them to cron
+sky_max_age = 24 * 3600  # Seconds after which the satellite TLEs are loaded again
+channel_file = 'watch_channels.json'  # Open channels, stopped when the service starts again
+
+
+# F U N C T I O N S ###########################################################
+
+
+def load_channels():
+    if os.path.exists(channel_file):
+        with open(channel_file) as f:
+            return json.load(f)
+    return {}
+
+
+def save_channels(channels):
+    tmp_file = channel_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(channels, f, indent=2)
+    os.replace(tmp_file, channel_file)
+
+
+def open_channel(service, calendarId, address, token):
+    """Watch the events of a calendar, return the channel with its calendarId."""
+    body = {'id': uuid.uuid4().hex, 'type': 'web_hook', 'address': address, 'token': token,
+            'params': {'ttl': str(channel_ttl)}}
+    channel = execute(service.events().watch(calendarId=calendarId, body=body))
+    channel['calendarId'] = calendarId
+    print(f"{calendarId}: watching with channel {channel['id']} until {time.ctime(int(channel['expiration']) / 1000)}")
+    return channel
+
+
+def close_channel(service, channel):
+    """Stop the notifications of a channel, it may already have expired."""
+    try:
+        execute(service.channels().stop(body={'id': channel['id'], 'resourceId': channel['resourceId']}))
+    except HttpError as e:
+        if e.resp.status != 404:
+            raise
+
+
+def handler_class(watcher):
+    """Request handler posting the calendarId of each valid notification to the watcher's queue."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            if length:
+                self.rfile.read(length)
+            if self.path.split('?')[0] != notification_path:
+                self.send_response(404)
+            else:
+                watcher.notified(self.headers.get('X-Goog-Channel-ID'), self.headers.get('X-Goog-Channel-Token'),
+                                 self.headers.get('X-Goog-Resource-State'))
+                # Google retries the notifications that are not acknowledged, ignored ones included
+                self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    return Handler
+
+
+class Watcher(object):
+    """Notification endpoint, channels, and the warm state used to handle the changes."""
+
+    def __init__(self):
+        self.token = secrets.token_urlsafe(24)  # Sent back by Google with each notification
+        self.queue = queue.Queue()
+        self.channels = {}  # Channel id: channel
+        self.local_zone = calendar_reminders.timezone or get_localzone()
+        self.policy = calendar_reminders.load_policy()
+        self.service = get_service()
+        self.mirror = None
+        self.httpd = ThreadingHTTPServer((listen_host, listen_port), handler_class(self))
+        self.httpd.daemon_threads = True
+        self.next_iss = time.time()
+        self.sky_loaded = None
+        self.failures = {}  # Step name: consecutive failures
+
+    @property
+    def address(self):
+        host, port = self.httpd.server_address[:2]
+        return webhook_url or f'http://{host}:{port}{notification_path}'
+
+    def notified(self, channel_id, token, state):
+        """Called by the endpoint threads, return the calendarId of a valid notification."""
+        channel = self.channels.get(channel_id)
+        if channel is None or token != self.token:
+            metrics.count('notifications.ignored')
+            return None
+        metrics.count('notifications.received')
+        # 'sync' only confirms that the channel is open, 'exists' / 'not_exists' report a change
+        if state != 'sync':
+            self.queue.put(channel['calendarId'])
+        return channel['calendarId']
+
+    def open_channels(self):
+        """Stop the channels of a previous run, then watch every calendar not watched yet."""
+        for channel in load_channels().values():
+            if channel['id'] not in self.channels:
+                close_channel(self.service, channel)
+        watched = {channel['calendarId'] for channel in self.channels.values()}
+        for calendarId in calendar_reminders.calendars:
+            if calendarId not in watched:
+                channel = open_channel(self.service, calendarId, self.address, self.token)
+                self.channels[channel['id']] = channel
+                save_channels(self.channels)
+
+    def renew_channels(self):
+        """Replace the channels about to expire, the new one is open before the old one is stopped."""
+        deadline = (time.time() + renew_margin) * 1000
+        for channel in [channel for channel in self.channels.values() if int(channel['expiration']) < deadline]:
+            renewed = open_channel(self.service, channel['calendarId'], self.address, self.token)
+            self.channels[renewed['id']] = renewed
+            del self.channels[channel['id']]
+            close_channel(self.service, channel)
+            save_channels(self.channels)
+
+    def close_channels(self):
+        """Stop the channels, the ones that cannot be stopped now expire on their own."""
+        for channel in list(self.channels.values()):
+            try:
+                close_channel(self.service, channel)
+            except Exception as e:
+                print(f"Could not stop channel {channel['id']} ({e})")
+        self.channels = {}
+        save_channels(self.channels)
+
+    def next_renewal(self):
+        if not self.channels:
+            return float('inf')
+        return min(int(channel['expiration']) for channel in self.channels.values()) / 1000 - renew_margin
+
+    def fix_reminders(self, calendarIds, full=False):
+        """Sync the calendars and apply the reminder policy to their changed (or upcoming) events."""
+        with metrics.timer('watch.reminders'):
+            writer = BatchWriter(self.service, callback=self.mirror.recorder(calendar_reminders.reminders_fixed),
+                                 max_per_second=calendar_reminders.max_patches_per_second)
+            now = time.time()
+            for calendarId in calendarIds:
+                changed = []
+                changes = self.mirror.sync(self.service, calendarId, force=True, changed=changed)
+                print(f'{calendarId}: {changes} changes')
+                events = self.mirror.upcoming(calendarId) if full else \
+                    [event for event in changed if (timestamp(event.get('end')) or 0) > now]
+                calendar_reminders.fix_reminders(writer, self.policy, calendarId, events, self.local_zone)
+            writer.flush()
+
+    def update_iss(self):
+        import iss_visible
+        if self.sky_loaded is None or time.time() - self.sky_loaded > sky_max_age:
+            # Keep the timescale and ephemeris code warm, but read the refreshed TLEs again
+            iss_visible._sky = None
+            self.sky_loaded = time.time()
+        with metrics.timer('watch.iss'):
+            iss_visible.update(self.mirror)
+        self.next_iss = time.time() + iss_interval
+
+    def step(self, name, function, *args):
+        """Run one step of the service loop, return True if it succeeded.
+
+        A failed step is logged, counted, and the loop backs off before trying it again.
+        """
+        try:
+            function(*args)
+        except Exception as e:
+            self.failures[name] = self.failures.get(name, 0) + 1
+            metrics.count('watch.errors')
+            delay = backoff(self.failures[name])
+            print(f'{name} failed ({e!r}), trying again in {delay:.1f}s')
+            time.sleep(delay)
+            return False
+        self.failures.pop(name, None)
+        return True
+
+    def wait(self, timeout):
+        """Return the set of calendars notified, waiting up to timeout seconds for the first notification."""
+        try:
+            calendarIds = {self.queue.get(timeout=max(timeout, 0))}
+        except queue.Empty:
+            return set()
+        # Changes often come in bursts, let them settle
+        time.sleep(settle_time)
+        while not self.queue.empty():
+            calendarIds.add(self.queue.get_nowait())
+        return calendarIds
+
+    def run(self):
+        """Serve the notifications until interrupted."""
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        print(f'Listening on {listen_host}:{self.httpd.server_address[1]}, notifications sent to {self.address}')
+        # The mirror is only used from this thread
+        self.mirror = EventMirror()
+        opened = False
+        full = True  # Check every upcoming event, at start and after a failed update
+        try:
+            while True:
+                if not opened:
+                    opened = self.step('Opening the channels', self.open_channels)
+                if full:
+                    full = not self.step('Fixing the reminders', self.fix_reminders, calendar_reminders.calendars, True)
+                deadline = min(self.next_renewal(), self.next_iss if iss_interval else float('inf'))
+                if not opened or full:
+                    deadline = time.time()
+                calendarIds = self.wait(deadline - time.time())
+                if calendarIds and not full:
+                    # The changes already synced for some calendars would be missed by a new incremental sync
+                    full = not self.step('Fixing the reminders', self.fix_reminders, sorted(calendarIds))
+                if time.time() >= self.next_renewal():
+                    self.step('Renewing the channels', self.renew_channels)
+                if iss_interval and time.time() >= self.next_iss:
+                    self.step('Updating the ISS fly-overs', self.update_iss)
+        finally:
+            self.close_channels()
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.mirror.close()
+
+
+def main():
+    """Main function."""
+    # Stop cleanly, closing the channels, when the service manager stops us
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        Watcher().run()
+    except KeyboardInterrupt:
+        pass
+
+
+###############################################################################
+
+if __name__ == "__main__":
+    main()
+
+# E N D   O F   F I L E #######################################################
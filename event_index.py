@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Local idempotency index of the events created by the import scripts.
+
+Each event is identified by a deterministic fingerprint (flight name + departure UTC +
+confirmation, or holiday date + summary), stored in a SQLite file along with the Google event
+ID it was created with. Re-running an import only costs a local lookup for the rows that were
+already created. The fingerprint is also used to derive a client-supplied event id, so the
+Calendar API itself rejects duplicates (409) if the local index was lost.
+
+Source: https://github.com/Christophe-Gauge/Google-Calendar
+'''
+
+# I M P O R T S ###############################################################
+
+import hashlib
+import sqlite3
+from datetime import timezone
+
+
+__author__ = "Christophe Gauge"
+__version__ = "1.0.1"
+__license__ = "GNU General Public License v3.0"
+
+
+# G L O B A L S ###############################################################
+
+index_file = 'event_index.sqlite'
+
+
+# F U N C T I O N S ###########################################################
+
+
+def fingerprint(*parts):
+    """Return a stable fingerprint for the given values."""
+    text = '\x1f'.join(str(part).strip() for part in parts)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def flight_fingerprint(leg):
+    return fingerprint('flight', leg.name, leg.departure.astimezone(timezone.utc).isoformat(), leg.confirmation)
+
+
+def holiday_fingerprint(date, summary):
+    return fingerprint('holiday', date, summary)
+
+
+def event_id(fingerprint):
+    """Event id derived from a fingerprint, hex digits are valid base32hex characters."""
+    return 'gc' + fingerprint
+
+
+def is_duplicate(exception):
+    """True if the insert failed because an event with the same id already exists."""
+    return getattr(getattr(exception, 'resp', None), 'status', None) == 409
+
+
+class EventIndex(object):
+    """Persistent (calendarId, fingerprint) -> event id mapping."""
+
+    def __init__(self, filename=index_file):
+        self.db = sqlite3.connect(filename)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS events (
+                             calendar_id TEXT NOT NULL,
+                             fingerprint TEXT NOT NULL,
+                             event_id TEXT NOT NULL,
+                             PRIMARY KEY (calendar_id, fingerprint))''')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, calendarId, fingerprint):
+        """Return the id of the event already created for this fingerprint, or None."""
+        row = self.db.execute('SELECT event_id FROM events WHERE calendar_id = ? AND fingerprint = ?',
+                              (calendarId, fingerprint)).fetchone()
+        return row[0] if row else None
+
+    def add(self, calendarId, fingerprint, event_id):
+        self.db.execute('INSERT OR REPLACE INTO events (calendar_id, fingerprint, event_id) VALUES (?, ?, ?)',
+                        (calendarId, fingerprint, event_id))
+
+    def remove(self, calendarId, fingerprint):
+        self.db.execute('DELETE FROM events WHERE calendar_id = ? AND fingerprint = ?', (calendarId, fingerprint))
+
+    def recorder(self, calendarId=None):
+        """Return a BatchWriter callback recording created events, for keys of (label, fingerprint).
+
+        Without calendarId, the callback is for writes to several calendars, with keys of
+        (calendarId, label, fingerprint).
+        """
+        def record(key, event, exception):
+            calendar, (label, fingerprint) = (calendarId, key) if calendarId else (key[0], key[1:])
+            if exception is None:
+                self.add(calendar, fingerprint, event['id'])
+                print(f'{label}: Event created: %s' % (event.get('htmlLink')))
+            elif is_duplicate(exception):
+                self.add(calendar, fingerprint, event_id(fingerprint))
+                print(f'{label}: Already in the calendar')
+            else:
+                print(f'{label}: ERROR {exception}')
+        return record
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+# E N D   O F   F I L E #######################################################
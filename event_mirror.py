@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Local SQLite mirror of Google Calendars, kept up to date by incremental sync.
+
+Each mirrored calendar is read in full once, then only the changes since the last sync token
+are applied, and our own successful writes are applied as they are confirmed. A calendar
+synced less than max_age seconds ago is not synced again, so most runs make no list call.
+
+The scripts query the mirror instead of listing events:
+- events(): the events of a time window, optionally with an exact summary,
+- upcoming(): the events that have not ended yet,
+both answered from indexes on start time and summary.
+
+Assumes that the Google Calendar libraries are installed and configured:
+pip3 install --upgrade google-api-python-client google-auth-httplib2 google-auth-oauthlib
+
+Source: https://github.com/Christophe-Gauge/Google-Calendar
+'''
+
+# I M P O R T S ###############################################################
+
+import json
+import sqlite3
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from dateutil.parser import parse as dtparse
+from dateutil.tz import UTC
+from googleapiclient.errors import HttpError
+from calendar_sync import sync_events
+
+
+__author__ = "Christophe Gauge"
+__version__ = "1.0.1"
+__license__ = "GNU General Public License v3.0"
+
+
+# G L O B A L S ###############################################################
+
+mirror_file = 'event_mirror.sqlite'
+max_age = 600  # Seconds during which a synced calendar is trusted without asking for changes
+schema_version = 2  # Bumped when the tables change, an older mirror is dropped and read again in full
+
+schema = '''
+CREATE TABLE IF NOT EXISTS calendars (
+    calendar_id TEXT PRIMARY KEY,
+    sync_token TEXT,
+    synced REAL);
+CREATE TABLE IF NOT EXISTS events (
+    calendar_id TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    summary TEXT,
+    start_time REAL,
+    end_time REAL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (calendar_id, event_id));
+CREATE INDEX IF NOT EXISTS events_start ON events (calendar_id, start_time);
+CREATE INDEX IF NOT EXISTS events_summary ON events (calendar_id, summary, start_time);
+'''
+
+
+# F U N C T I O N S ###########################################################
+
+
+def timestamp(value):
+    """Epoch seconds of an event start or end, all-day dates are taken at midnight UTC."""
+    if not value:
+        return None
+    if 'dateTime' not in value:
+        return datetime.fromisoformat(value['date']).replace(tzinfo=UTC).timestamp()
+    moment = dtparse(value['dateTime'])
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=ZoneInfo(value['timeZone']) if value.get('timeZone') else UTC)
+    return moment.timestamp()
+
+
+class EventMirror(object):
+    """On-disk copy of the events of one or more calendars."""
+
+    def __init__(self, filename=mirror_file):
+        self.db = sqlite3.connect(filename)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != schema_version:
+            for table, in self.db.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+                self.db.execute(f'DROP TABLE {table}')
+            self.db.execute(f'PRAGMA user_version = {schema_version}')
+        self.db.executescript(schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.db.rollback()
+        self.close()
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    # Updates
+
+    def upsert(self, calendarId, event):
+        """Store an event, or remove it if it is cancelled."""
+        self.remove(calendarId, event['id'])
+        if event.get('status') == 'cancelled':
+            return
+        self.db.execute('INSERT INTO events VALUES (?, ?, ?, ?, ?, ?)',
+                        (calendarId, event['id'], event.get('summary'),
+                         timestamp(event.get('start')), timestamp(event.get('end')), json.dumps(event)))
+
+    def remove(self, calendarId, eventId):
+        self.db.execute('DELETE FROM events WHERE calendar_id = ? AND event_id = ?', (calendarId, eventId))
+
+    def clear(self, calendarId):
+        """Forget everything about a calendar, the next sync reads it in full."""
+        for table in ('events', 'calendars'):
+            self.db.execute(f'DELETE FROM {table} WHERE calendar_id = ?', (calendarId,))
+
+    def sync_state(self, calendarId):
+        """Return (sync token, time of the last sync) of a calendar, (None, None) if never synced."""
+        row = self.db.execute('SELECT sync_token, synced FROM calendars WHERE calendar_id = ?', (calendarId,)).fetchone()
+        return row if row else (None, None)
+
+    def sync(self, service, calendarId, force=False, changed=None):
+        """Apply the changes made to a calendar since the last sync, return how many there were.
+
+        Unless forced, nothing is asked to the API if the calendar was synced less than max_age
+        seconds ago. The changed events that are not cancelled are appended to the changed list.
+        """
+        token, synced = self.sync_state(calendarId)
+        if not force and token and synced and time.time() - synced < max_age:
+            return 0
+        calendars = {calendarId: token}
+        if token is None:
+            self.clear(calendarId)
+        changes = 0
+        for event in sync_events(service, calendars, calendarId, on_reset=lambda: self.clear(calendarId)):
+            self.upsert(calendarId, event)
+            changes += 1
+            if changed is not None and event.get('status') != 'cancelled':
+                changed.append(event)
+        self.db.execute('INSERT OR REPLACE INTO calendars VALUES (?, ?, ?)', (calendarId, calendars[calendarId], time.time()))
+        self.db.commit()
+        return changes
+
+    def invalidate(self, calendarId):
+        """Make the next sync of a calendar ask for its changes, even if it was synced recently."""
+        self.db.execute('UPDATE calendars SET synced = NULL WHERE calendar_id = ?', (calendarId,))
+
+    def recorder(self, callback=None):
+        """Return a BatchWriter callback applying our own writes to the mirror, then calling callback.
+
+        The keys of the writes must start with the calendarId. A write rejected with 412 means
+        that the mirrored copy of the event is stale, the calendar is synced again on next use.
+        """
+        def record(key, event, exception):
+            if exception is None and event:
+                self.upsert(key[0], event)
+            elif isinstance(exception, HttpError) and exception.resp.status == 412:
+                self.invalidate(key[0])
+            if callback is not None:
+                callback(key, event, exception)
+        return record
+
+    # Queries
+
+    def _events(self, query, parameters):
+        return [json.loads(data) for data, in self.db.execute(query, parameters)]
+
+    def events(self, calendarId, start, end, summary=None):
+        """Return the events overlapping [start, end) (aware datetimes), in start order."""
+        query = 'SELECT data FROM events WHERE calendar_id = ? AND start_time < ? AND end_time > ?'
+        parameters = [calendarId, end.timestamp(), start.timestamp()]
+        if summary is not None:
+            query += ' AND summary = ?'
+            parameters.append(summary)
+        return self._events(query + ' ORDER BY start_time', parameters)
+
+    def upcoming(self, calendarId, after=None):
+        """Return the events ending after after (now by default), timed and all-day, in start order.
+
+        The rows are read in full before returning, the caller may write to the mirror (e.g. with
+        recorder()) while going through them.
+        """
+        after = (after or datetime.now(UTC)).timestamp()
+        return self._events('SELECT data FROM events WHERE calendar_id = ? AND end_time > ? ORDER BY start_time',
+                            (calendarId, after))
+
+
+# E N D   O F   F I L E #######################################################
@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Local stand-in for the Google Calendar v3 REST API, for tests and benchmarks.
+
+Implements events list (pagination, syncToken, timeMin / timeMax, q, privateExtendedProperty,
+orderBy, a simple fields mask), get, insert, patch and update (with If-Match), delete, and the
+HTTP batch endpoint, on an in-memory store. Latency and 429 rateLimitExceeded answers can be
+injected, and the server counts API calls and bytes transferred.
+
+It also stands in for Google's push notifications: events.watch opens a channel, channels.stop
+closes it, and every change of a watched calendar is posted to the channel address with the
+X-Goog-* headers Google sends (send_notification() can also be called directly in tests).
+
+Point the scripts at it with the GCAL_API_URL environment variable, e.g.:
+./fake_calendar_server.py --port 8080 --latency 0.05 --error-rate 0.01 &
+GCAL_API_URL=http://127.0.0.1:8080 ./calendar_reminders.py
+
+Source: https://github.com/Christophe-Gauge/Google-Calendar
+'''
+
+# I M P O R T S ###############################################################
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import urllib.request
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from email.utils import formatdate
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from zoneinfo import ZoneInfo
+
+
+__author__ = "Christophe Gauge"
+__version__ = "1.0.1"
+__license__ = "GNU General Public License v3.0"
+
+
+# G L O B A L S ###############################################################
+
+api_prefix = '/calendar/v3'
+batch_prefix = '/batch/calendar/v3'
+default_page_size = 250
+max_page_size = 2500
+default_channel_ttl = 7 * 24 * 3600  # Seconds, the longest Google grants to an events channel
+
+events_path = re.compile(r'^/calendars/([^/]+)/events(?:/([^/]+))?$')
+
+
+# F U N C T I O N S ###########################################################
+
+
+class ApiError(Exception):
+
+    def __init__(self, status, reason, message=''):
+        Exception.__init__(self, message or reason)
+        self.status = status
+        self.reason = reason
+
+    def body(self):
+        return {'error': {'code': self.status, 'message': str(self),
+                          'errors': [{'domain': 'usageLimits' if self.status == 429 else 'global',
+                                      'reason': self.reason, 'message': str(self)}]}}
+
+
+def timestamp(value):
+    """Epoch seconds of an event start / end dict."""
+    if not value:
+        return 0.0
+    if 'dateTime' in value:
+        moment = datetime.fromisoformat(value['dateTime'].replace('Z', '+00:00'))
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=ZoneInfo(value.get('timeZone') or 'UTC'))
+        return moment.timestamp()
+    return datetime.fromisoformat(value['date']).replace(tzinfo=timezone.utc).timestamp()
+
+
+def rfc3339(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def send_notification(channel, state='exists', number=1):
+    """POST a push notification to a channel's address the way Google does, return the HTTP status or None."""
+    headers = {'X-Goog-Channel-ID': channel['id'],
+               'X-Goog-Channel-Expiration': formatdate(int(channel['expiration']) / 1000, usegmt=True),
+               'X-Goog-Resource-ID': channel['resourceId'],
+               'X-Goog-Resource-URI': channel['resourceUri'],
+               'X-Goog-Resource-State': state,
+               'X-Goog-Message-Number': str(number),
+               'Content-Length': '0'}
+    if channel.get('token'):
+        headers['X-Goog-Channel-Token'] = channel['token']
+    request = urllib.request.Request(channel['address'], data=b'', headers=headers, method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except OSError:
+        return None
+
+
+def apply_fields(response, fields):
+    """Apply a simple 'nextPageToken,items(id,summary)' fields mask to a list response."""
+    if not fields:
+        return response
+    match = re.search(r'items\(([^)]*)\)', fields)
+    top = set(re.sub(r'items\([^)]*\)', 'items', fields).split(','))
+    masked = {key: value for key, value in response.items() if key in top}
+    if match and 'items' in masked:
+        keep = set(match.group(1).split(','))
+        masked['items'] = [{key: value for key, value in item.items() if key in keep} for item in masked['items']]
+    return masked
+
+
+class CalendarStore(object):
+    """In-memory calendars, each a dict of events, with a global change sequence for syncTokens."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.calendars = {}
+        self.sequence = 0
+        self.calls = Counter()
+        self.channels = {}  # Channel id: channel, with its calendarId and message number
+
+    def calendar(self, calendarId):
+        return self.calendars.setdefault(calendarId, {})
+
+    def _stamp(self, event):
+        self.sequence += 1
+        event['etag'] = f'"{self.sequence}"'
+        event['updated'] = rfc3339(time.time())
+        event['_sequence'] = self.sequence
+        event['_start'] = timestamp(event.get('start'))
+        event['_end'] = timestamp(event.get('end'))
+        return event
+
+    @staticmethod
+    def public(event):
+        return {key: value for key, value in event.items() if not key.startswith('_')}
+
+    def seed(self, calendarId, events):
+        """Add events directly, without going through the API or the counters."""
+        with self.lock:
+            calendar = self.calendar(calendarId)
+            for body in events:
+                event = dict(body)
+                event.setdefault('id', uuid.uuid4().hex)
+                event.setdefault('status', 'confirmed')
+                event.setdefault('reminders', {'useDefault': True})
+                calendar[event['id']] = self._stamp(event)
+
+    def list(self, calendarId, params):
+        self.calls['events.list'] += 1
+        single = lambda name, default=None: params.get(name, [default])[0]
+        page_size = min(int(single('maxResults', default_page_size)), max_page_size)
+        # Page tokens carry the change sequence of the first page (the next sync starts from it)
+        # and a position: an offset in insertion / start time order, or, for syncs, the sequence
+        # of the last event sent, so that the changes made while paging never shift the pages
+        sequence, position = map(int, single('pageToken', '-1:0').split(':'))
+        with self.lock:
+            events = list(self.calendar(calendarId).values())
+            sequence = self.sequence if sequence < 0 else sequence
+        sync_token = single('syncToken')
+        if sync_token:
+            if int(sync_token) > sequence:
+                raise ApiError(410, 'fullSyncRequired', 'Sync token is no longer valid, a full sync is required.')
+            since = max(int(sync_token), position)
+            events = sorted((event for event in events if since < event['_sequence'] <= sequence),
+                            key=lambda event: event['_sequence'])
+            page, more = events[:page_size], len(events) > page_size
+            position = page[-1]['_sequence'] if page else position
+        else:
+            if single('showDeleted', 'false') != 'true':
+                events = [event for event in events if event.get('status') != 'cancelled']
+            if single('timeMin'):
+                minimum = timestamp({'dateTime': single('timeMin')})
+                events = [event for event in events if event['_end'] > minimum]
+            if single('timeMax'):
+                maximum = timestamp({'dateTime': single('timeMax')})
+                events = [event for event in events if event['_start'] < maximum]
+            if single('q'):
+                q = single('q').lower()
+                events = [event for event in events
+                          if q in (event.get('summary', '') + ' ' + event.get('description', '')).lower()]
+            for condition in params.get('privateExtendedProperty', []):
+                name, _, value = condition.partition('=')
+                events = [event for event in events
+                          if event.get('extendedProperties', {}).get('private', {}).get(name) == value]
+            if single('orderBy') == 'startTime':
+                events.sort(key=lambda event: (event['_start'], event['id']))
+            page, more = events[position:position + page_size], len(events) > position + page_size
+            position += page_size
+        response = {'kind': 'calendar#events', 'items': [self.public(event) for event in page]}
+        if more:
+            response['nextPageToken'] = f'{sequence}:{position}'
+        else:
+            response['nextSyncToken'] = str(sequence)
+        return apply_fields(response, single('fields'))
+
+    def get(self, calendarId, eventId):
+        self.calls['events.get'] += 1
+        with self.lock:
+            event = self.calendar(calendarId).get(eventId)
+            if event is None:
+                raise ApiError(404, 'notFound', 'Not Found')
+            return self.public(event)
+
+    def insert(self, calendarId, body):
+        self.calls['events.insert'] += 1
+        with self.lock:
+            calendar = self.calendar(calendarId)
+            event = dict(body)
+            event.setdefault('id', uuid.uuid4().hex)
+            if event['id'] in calendar:
+                raise ApiError(409, 'duplicate', 'The requested identifier already exists.')
+            event.setdefault('status', 'confirmed')
+            event.setdefault('reminders', {'useDefault': True})
+            event['kind'] = 'calendar#event'
+            event['htmlLink'] = f'http://calendar.local/event?eid={event["id"]}'
+            event['created'] = rfc3339(time.time())
+            calendar[event['id']] = self._stamp(event)
+            self.changed(calendarId)
+            return self.public(event)
+
+    def modify(self, calendarId, eventId, body, etag, replace):
+        self.calls['events.update' if replace else 'events.patch'] += 1
+        with self.lock:
+            event = self.calendar(calendarId).get(eventId)
+            if event is None or event.get('status') == 'cancelled':
+                raise ApiError(404, 'notFound', 'Not Found')
+            if etag and etag != event['etag']:
+                raise ApiError(412, 'conditionNotMet', 'Precondition Failed')
+            if replace:
+                kept = {key: event[key] for key in ('id', 'kind', 'htmlLink', 'created') if key in event}
+                event.clear()
+                event.update(kept)
+            event.update({key: value for key, value in body.items() if key not in ('id', 'etag')})
+            self.changed(calendarId)
+            return self.public(self._stamp(event))
+
+    def delete(self, calendarId, eventId, etag):
+        self.calls['events.delete'] += 1
+        with self.lock:
+            event = self.calendar(calendarId).get(eventId)
+            if event is None:
+                raise ApiError(404, 'notFound', 'Not Found')
+            if event.get('status') == 'cancelled':
+                raise ApiError(410, 'deleted', 'Resource has been deleted')
+            if etag and etag != event['etag']:
+                raise ApiError(412, 'conditionNotMet', 'Precondition Failed')
+            event['status'] = 'cancelled'
+            self._stamp(event)
+            self.changed(calendarId)
+            return None
+
+    def watch(self, calendarId, body):
+        self.calls['events.watch'] += 1
+        if body.get('type') not in ('web_hook', 'webhook') or not body.get('address') or not body.get('id'):
+            raise ApiError(400, 'invalid', 'A web_hook channel needs an id and an address.')
+        ttl = int(body.get('params', {}).get('ttl', default_channel_ttl))
+        with self.lock:
+            if body['id'] in self.channels:
+                raise ApiError(400, 'channelIdNotUnique', 'Channel id not unique.')
+            channel = {'kind': 'api#channel', 'id': body['id'], 'resourceId': uuid.uuid4().hex,
+                       'resourceUri': f'{api_prefix}/calendars/{calendarId}/events',
+                       'expiration': str(int((time.time() + min(ttl, default_channel_ttl)) * 1000))}
+            if body.get('token'):
+                channel['token'] = body['token']
+            self.channels[body['id']] = dict(channel, address=body['address'], _calendarId=calendarId, _number=0)
+        self.notify([self.channels[body['id']]], 'sync')
+        return channel
+
+    def stop(self, body):
+        self.calls['channels.stop'] += 1
+        with self.lock:
+            channel = self.channels.get(body.get('id'))
+            if channel is None or channel['resourceId'] != body.get('resourceId'):
+                raise ApiError(404, 'notFound', f"Channel {body.get('id')} not found for resource {body.get('resourceId')}")
+            del self.channels[body['id']]
+        return None
+
+    def changed(self, calendarId):
+        """Notify the live channels watching a calendar."""
+        with self.lock:
+            now = time.time() * 1000
+            channels = [channel for channel in self.channels.values()
+                        if channel['_calendarId'] == calendarId and int(channel['expiration']) > now]
+        if channels:
+            self.notify(channels, 'exists')
+
+    def notify(self, channels, state):
+        """Send the notifications from a thread, like Google they are not part of the API call."""
+        messages = []
+        with self.lock:
+            for channel in channels:
+                channel['_number'] += 1
+                messages.append((self.public(channel), channel['_number']))
+        for channel, number in messages:
+            threading.Thread(target=send_notification, args=(channel, state, number), daemon=True).start()
+
+
+class FakeCalendarServer(object):
+    """Threaded HTTP server around a CalendarStore.
+
+    latency: seconds added to every HTTP request, error_rate: probability of answering 429 to
+    an API call (batched calls included).
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0):
+        self.store = CalendarStore()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self.handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def count(self, **counts):
+        with self.stats_lock:
+            self.stats.update(counts)
+
+    def api_calls(self):
+        return sum(self.store.calls.values())
+
+    def call(self, method, path, query, headers, body):
+        """Run one API call, return (status, response dict or None)."""
+        if self.error_rate and random.random() < self.error_rate:
+            self.count(throttled=1)
+            raise ApiError(429, 'rateLimitExceeded', 'Rate Limit Exceeded')
+        if path.startswith(api_prefix):
+            path = path[len(api_prefix):]
+        data = json.loads(body) if body else {}
+        if path == '/channels/stop' and method == 'POST':
+            return 204, self.store.stop(data)
+        match = events_path.match(path)
+        if not match:
+            raise ApiError(404, 'notFound', f'Unknown path {path}')
+        calendarId, eventId = unquote(match.group(1)), match.group(2) and unquote(match.group(2))
+        params = parse_qs(query)
+        etag = headers.get('if-match')
+        if eventId == 'watch' and method == 'POST':
+            return 200, self.store.watch(calendarId, data)
+        if eventId is None and method == 'GET':
+            return 200, self.store.list(calendarId, params)
+        if eventId is None and method == 'POST':
+            return 200, self.store.insert(calendarId, data)
+        if eventId is not None and method == 'GET':
+            return 200, self.store.get(calendarId, eventId)
+        if eventId is not None and method in ('PATCH', 'PUT'):
+            return 200, self.store.modify(calendarId, eventId, data, etag, replace=(method == 'PUT'))
+        if eventId is not None and method == 'DELETE':
+            return 204, self.store.delete(calendarId, eventId, etag)
+        raise ApiError(405, 'methodNotAllowed', f'{method} not allowed on {path}')
+
+    def batch(self, content_type, body):
+        """Run the calls of a multipart/mixed batch, return (content type, body)."""
+        message = BytesParser().parsebytes(b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+        boundary = 'batch_' + uuid.uuid4().hex
+        parts = []
+        for part in message.get_payload():
+            request = part.get_payload(decode=False)
+            if isinstance(request, list):
+                continue
+            head, _, data = request.replace('\r\n', '\n').partition('\n\n')
+            lines = head.split('\n')
+            method, target = lines[0].split()[:2]
+            headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            target = urlsplit(target)
+            status, response = self.respond(method, target.path, target.query, headers, data.strip().encode())
+            content = json.dumps(response) if response is not None else ''
+            reason = {200: 'OK', 204: 'No Content'}.get(status, 'Error')
+            parts.append(f'--{boundary}\r\nContent-Type: application/http\r\n'
+                         f'Content-ID: <response-{part["Content-ID"].strip("<>")}>\r\n\r\n'
+                         f'HTTP/1.1 {status} {reason}\r\nContent-Type: application/json; charset=UTF-8\r\n'
+                         f'Content-Length: {len(content.encode())}\r\n\r\n{content}\r\n')
+        self.count(batched_calls=len(parts))
+        return f'multipart/mixed; boundary={boundary}', (''.join(parts) + f'--{boundary}--\r\n').encode()
+
+    def respond(self, method, path, query, headers, body):
+        try:
+            return self.call(method, path, query, headers, body)
+        except ApiError as e:
+            return e.status, e.body()
+
+    def handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def handle_any(self):
+                length = int(self.headers.get('content-length', 0))
+                body = self.rfile.read(length) if length else b''
+                if server.latency:
+                    time.sleep(server.latency)
+                target = urlsplit(self.path)
+                content_type = 'application/json; charset=UTF-8'
+                if target.path.startswith(batch_prefix):
+                    status = 200
+                    content_type, content = server.batch(self.headers.get('content-type', ''), body)
+                else:
+                    headers = {name.lower(): value for name, value in self.headers.items()}
+                    status, response = server.respond(self.command, target.path, target.query, headers, body)
+                    content = json.dumps(response).encode() if response is not None else b''
+                server.count(http_requests=1, bytes_in=len(body) + len(self.path), bytes_out=len(content))
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = handle_any
+
+        return Handler
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description='Local fake Google Calendar API server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to each HTTP request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Probability of a 429 answer per API call')
+    args = parser.parse_args()
+    server = FakeCalendarServer(args.host, args.port, args.latency, args.error_rate)
+    print(f'Fake Calendar API listening on {server.url}')
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(dict(server.stats), dict(server.store.calls))
+
+
+###############################################################################
+
+if __name__ == "__main__":
+    main()
+
+# E N D   O F   F I L E #######################################################
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Single command line entry point for the scripts of this repository.
+
+./gcal.py reminders                       Set popup reminders on the upcoming timed events
+./gcal.py flights itinerary.yaml          Add the flights of an itinerary
+./gcal.py holidays --reconcile            Add (or reconcile) the work holidays
+./gcal.py iss --days 30                   Add the visible ISS fly-overs
+./gcal.py watch --port 8765               Fix the reminders as the calendars change, see calendar_watch.py
+./gcal.py airports-refresh                Rebuild the airport timezone files
+
+The module of a subcommand, and so the Google or skyfield libraries it needs, is only
+imported once that subcommand is selected, and none of the modules does any work at import
+time. --startup-time prints how long that import took, the cold start of a cron job.
+
+Source: https://github.com/Christophe-Gauge/Google-Calendar
+'''
+
+# I M P O R T S ###############################################################
+
+import argparse
+import importlib
+import os
+import sys
+import time
+
+
+__author__ = "Christophe Gauge"
+__version__ = "1.0.1"
+__license__ = "GNU General Public License v3.0"
+
+
+# G L O B A L S ###############################################################
+
+_started = time.perf_counter()
+
+
+# F U N C T I O N S ###########################################################
+
+
+def load(name, args):
+    """Import the module of a subcommand, timing the import."""
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    seconds = time.perf_counter() - started
+    if args.startup_time:
+        print(f'{name}: imported in {seconds:.3f}s, {time.perf_counter() - _started:.3f}s since gcal started',
+              file=sys.stderr)
+    import metrics
+    if metrics.enabled:
+        metrics.job = args.command
+        metrics.record('startup.import', seconds)
+    return module
+
+
+def reminders(args):
+    module = load('calendar_reminders', args)
+    if args.calendar:
+        module.calendars = {calendarId: None for calendarId in args.calendar}
+    if args.no_sync:
+        module.sync_mode = False
+    if args.policy:
+        module.policy_file = args.policy
+    if args.use_async:
+        module.use_async_client = True
+    module.main()
+
+
+def flights(args):
+    module = load('add_flight_info', args)
+    if args.use_async:
+        module.use_async_client = True
+    module.main(args.itinerary)
+
+
+def holidays(args):
+    module = load('add_work_holidays', args)
+    if args.year:
+        module.years = list(range(args.year, args.year + args.years))
+    if args.reconcile:
+        module.reconcile_with_calendar = True
+    module.main()
+
+
+def iss(args):
+    module = load('iss_visible', args)
+    if args.days:
+        module.number_of_days_to_process = args.days
+    if args.use_async:
+        module.use_async_client = True
+    module.main()
+
+
+def watch(args):
+    module = load('calendar_watch', args)
+    reminders_module = sys.modules['calendar_reminders']
+    if args.calendar:
+        reminders_module.calendars = {calendarId: None for calendarId in args.calendar}
+    if args.policy:
+        reminders_module.policy_file = args.policy
+    if args.port is not None:
+        module.listen_port = args.port
+    if args.url:
+        module.webhook_url = args.url
+    if args.no_iss:
+        module.iss_interval = None
+    module.main()
+
+
+def airports_refresh(args):
+    module = load('get_airports_timezone', args)
+    module.main(args.source or module.URL, args.force)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='gcal', description='Useful Google Calendar scripts')
+    parser.add_argument('--metrics', metavar='FILE', help='Write a run report (.prom or JSON), see metrics.py')
+    parser.add_argument('--startup-time', action='store_true', help='Print how long the subcommand took to load')
+    commands = parser.add_subparsers(dest='command', metavar='command', required=True)
+
+    command = commands.add_parser('reminders', help='Set popup reminders on the upcoming timed events')
+    command.add_argument('--calendar', action='append', metavar='ID', help='Calendar to process (repeatable)')
+    command.add_argument('--no-sync', action='store_true', help='Only look at the next events, without sync tokens')
+    command.add_argument('--policy', metavar='FILE', help='YAML file of reminder rules, see reminder_policy.py')
+    command.add_argument('--async', dest='use_async', action='store_true', help='Use the asyncio client')
+    command.set_defaults(run=reminders)
+
+    command = commands.add_parser('flights', help='Add the flights of an itinerary (.yaml, .csv or .jsonl)')
+    command.add_argument('itinerary', nargs='?', help='Itinerary file, the example itinerary by default')
+    command.add_argument('--async', dest='use_async', action='store_true', help='Use the asyncio client')
+    command.set_defaults(run=flights)
+
+    command = commands.add_parser('holidays', help='Add the work holidays')
+    command.add_argument('--year', type=int, help='First year')
+    command.add_argument('--years', type=int, default=1, help='Number of years, from --year')
+    command.add_argument('--reconcile', action='store_true', help='Make the calendar match the holidays exactly')
+    command.set_defaults(run=holidays)
+
+    command = commands.add_parser('iss', help='Add the visible ISS fly-overs')
+    command.add_argument('--days', type=int, help='Number of days to predict')
+    command.add_argument('--async', dest='use_async', action='store_true', help='Use the asyncio client')
+    command.set_defaults(run=iss)
+
+    command = commands.add_parser('watch', help='Fix the reminders as soon as the calendars change')
+    command.add_argument('--calendar', action='append', metavar='ID', help='Calendar to watch (repeatable)')
+    command.add_argument('--policy', metavar='FILE', help='YAML file of reminder rules, see reminder_policy.py')
+    command.add_argument('--port', type=int, help='Port of the local notification endpoint')
+    command.add_argument('--url', help='Public HTTPS address forwarded to the local endpoint')
+    command.add_argument('--no-iss', action='store_true', help='Do not update the ISS fly-overs')
+    command.set_defaults(run=watch)
+
+    command = commands.add_parser('airports-refresh', help='Rebuild airport_timezone.tsv and its index')
+    command.add_argument('source', nargs='?', help="URL or local copy of the opentraveldata file, '-' for stdin")
+    command.add_argument('--force', action='store_true', help='Rewrite the files even if the data did not change')
+    command.set_defaults(run=airports_refresh)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Main function."""
+    args = parse_args(argv)
+    if args.metrics:
+        # Read by metrics.py when it is first imported, by the subcommand module
+        os.environ['GCAL_METRICS'] = args.metrics
+    args.run(args)
+
+
+###############################################################################
+
+if __name__ == "__main__":
+    main()
+
+# E N D   O F   F I L E #######################################################
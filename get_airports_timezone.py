@@ -5,14 +5,29 @@
 Retrieve opentraveldata CSV file from GitHub and save the world airports IATA Code, Name and TimeZone into a TSV file.
 https://github.com/opentraveldata/opentraveldata
 
+The caret-separated file is streamed row by row, only the iata_code, name and timezone columns
+are kept (the last row wins for a duplicated code), and the TSV file and its binary index are
+replaced atomically. The ETag / Last-Modified of the download and a SHA-256 of the content are
+kept in airport_timezone.state.json, so nothing is rewritten when the data did not change.
+
+./get_airports_timezone.py                      Refresh from GitHub
+./get_airports_timezone.py optd_por_public_all.csv    Refresh from a local copy ('-' for stdin)
+
 Source: https://github.com/Christophe-Gauge/Google-Calendar
 '''
 
 # I M P O R T S ###############################################################
 
-import pandas as pd
-import ssl
-ssl._create_default_https_context = ssl._create_unverified_context
+import argparse
+import csv
+import hashlib
+import json
+import os
+import os.path
+import sys
+import urllib.error
+import urllib.request
+from airport_index import compile_index, index_file, tsv_file
 
 __author__ = "Christophe Gauge"
 __version__ = "1.0.1"
@@ -23,10 +38,135 @@ __license__ = "GNU General Public License v3.0"
 
 URL = 'https://raw.githubusercontent.com/opentraveldata/opentraveldata/master/opentraveldata/optd_por_public_all.csv'
 
-df = pd.read_csv(URL, sep = "^", usecols=["iata_code", "name", "timezone"], index_col = False, low_memory=False)
-df = df[df.iata_code.notnull()]
-df.reset_index(drop=True, inplace = True)
-df.drop_duplicates(subset ="iata_code", keep = "last", inplace = True)
+state_file = 'airport_timezone.state.json'
+columns = ('iata_code', 'name', 'timezone')
+timeout = 60  # Seconds
+
+
+# F U N C T I O N S ###########################################################
+
+
+def load_state():
+    if os.path.exists(state_file):
+        with open(state_file) as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(state):
+    tmp_file = state_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_file, state_file)
+
+
+def open_source(source, state):
+    """Return (binary stream, validators) for a URL, a file name or '-', None if not modified."""
+    if source == '-':
+        return sys.stdin.buffer, {}
+    if '://' not in source:
+        return open(source, 'rb'), {}
+    request = urllib.request.Request(source)
+    if state.get('source') == source:
+        if state.get('etag'):
+            request.add_header('If-None-Match', state['etag'])
+        if state.get('last_modified'):
+            request.add_header('If-Modified-Since', state['last_modified'])
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None
+        raise
+    return response, {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+
+
+def read_lines(stream, digest):
+    """Yield the decoded lines of a binary stream, adding them to the digest."""
+    for line in stream:
+        digest.update(line)
+        yield line.decode('utf-8')
+
+
+def read_airports(lines):
+    """Yield (iata_code, name, timezone) for the rows of the caret-separated file that have an IATA code."""
+    reader = csv.reader(lines, delimiter='^')
+    header = next(reader, None)
+    if header is None:
+        return
+    positions = [header.index(column) for column in columns]
+    for row in reader:
+        if len(row) < len(header):
+            continue
+        iata_code, name, timezone = (row[position].strip() for position in positions)
+        if iata_code:
+            yield iata_code, name, timezone
+
+
+def keep_last(rows):
+    """Return {iata_code: (name, timezone)}, ordered by last occurrence, the last row of a code wins."""
+    airports = {}
+    for iata_code, name, timezone in rows:
+        airports.pop(iata_code, None)
+        airports[iata_code] = (name, timezone)
+    return airports
+
+
+def clean(text):
+    return text.replace('\t', ' ').replace('\n', ' ').replace('\r', ' ')
+
+
+def write_tsv(airports, filename=tsv_file):
+    """Atomically write the airports TSV file, with its header row."""
+    tmp_file = filename + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8', newline='\n') as f:
+        f.write('\t'.join(columns) + '\n')
+        for iata_code, (name, timezone) in airports.items():
+            f.write(f'{clean(iata_code)}\t{clean(name)}\t{clean(timezone)}\n')
+    os.replace(tmp_file, filename)
+
+
+def refresh(source=URL, force=False):
+    """Update the TSV file and its index from source, return the number of airports or None if unchanged."""
+    state = {} if force else load_state()
+    opened = open_source(source, state)
+    if opened is None:
+        print(f'{source} not modified since {state.get("last_modified") or state.get("etag")}')
+        return None
+    stream, validators = opened
+    digest = hashlib.sha256()
+    try:
+        airports = keep_last(read_airports(read_lines(stream, digest)))
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+
+    state.update(validators, source=source)
+    if not force and state.get('sha256') == digest.hexdigest() and os.path.exists(tsv_file):
+        print(f'{source} content unchanged, keeping {tsv_file}')
+        save_state(state)
+        return None
+    write_tsv(airports)
+    count = compile_index((code, name, timezone) for code, (name, timezone) in airports.items())
+    state['sha256'] = digest.hexdigest()
+    save_state(state)
+    return count
+
+
+def main(source=URL, force=False):
+    """Main function."""
+    count = refresh(source, force)
+    if count is not None:
+        print(count, f'airports written to {tsv_file} and {index_file}')
+
+
+###############################################################################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Refresh the airport timezone files from opentraveldata')
+    parser.add_argument('source', nargs='?', default=URL, help="URL, local copy of the CSV file or '-' for stdin")
+    parser.add_argument('--force', action='store_true', help='Rewrite the files even if the data did not change')
+    args = parser.parse_args()
+    main(args.source, args.force)
 
-print(df)
-df.to_csv('airport_timezone.tsv', sep="\t", index=False)
+# E N D   O F   F I L E #######################################################
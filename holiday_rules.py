@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Rule-based holiday calendars, expanded over any number of years and regions.
+
+A rule gives the date of a holiday in a given year: a fixed date, the nth (or last) weekday of
+a month, or a number of days from Easter, optionally moved by an offset (e.g. the day after
+Thanksgiving). A holiday falling on a weekend can be observed on a weekday:
+- NEAREST: Saturday moves to the Friday before, Sunday to the Monday after (US style),
+- FOLLOWING: both move to the Monday after (UK style),
+and an observed day never lands on another holiday of the same region, it keeps moving in the
+same direction until it finds a free weekday.
+
+Each region is a list of rules in rule_sets, expand() yields the observed holidays of several
+regions and years one region at a time.
+
+Source: https://github.com/Christophe-Gauge/Google-Calendar
+'''
+
+# I M P O R T S ###############################################################
+
+import calendar
+from collections import namedtuple
+from datetime import date, timedelta
+from dateutil.easter import easter
+
+
+__author__ = "Christophe Gauge"
+__version__ = "1.0.1"
+__license__ = "GNU General Public License v3.0"
+
+
+# G L O B A L S ###############################################################
+
+MONDAY, TUESDAY, WEDNESDAY, THURSDAY, FRIDAY, SATURDAY, SUNDAY = range(7)
+NEAREST = 'nearest'
+FOLLOWING = 'following'
+
+# month None means relative to Easter Sunday, day None means the nth weekday of the month (nth -1 for the last)
+Rule = namedtuple('Rule', ['name', 'month', 'day', 'weekday', 'nth', 'offset', 'observed', 'since'])
+Holiday = namedtuple('Holiday', ['region', 'name', 'date', 'actual'])
+
+
+# F U N C T I O N S ###########################################################
+
+
+def fixed(name, month, day, observed=NEAREST, since=None):
+    return Rule(name, month, day, None, None, 0, observed, since)
+
+
+def nth_weekday(name, month, weekday, nth, offset=0, since=None):
+    return Rule(name, month, None, weekday, nth, offset, None, since)
+
+
+def from_easter(name, offset, since=None):
+    return Rule(name, None, None, None, None, offset, None, since)
+
+
+rule_sets = {
+    'US': [
+        fixed("New Year's Day", 1, 1),
+        nth_weekday('Martin Luther King Jr. Day', 1, MONDAY, 3),
+        nth_weekday("Washington's Birthday", 2, MONDAY, 3),
+        nth_weekday('Memorial Day', 5, MONDAY, -1),
+        fixed('Juneteenth', 6, 19, since=2021),
+        fixed('Independence Day', 7, 4),
+        nth_weekday('Labor Day', 9, MONDAY, 1),
+        nth_weekday('Columbus Day', 10, MONDAY, 2),
+        fixed('Veterans Day', 11, 11),
+        nth_weekday('Thanksgiving Day', 11, THURSDAY, 4),
+        fixed('Christmas Day', 12, 25),
+    ],
+    'UK-ENG': [
+        fixed("New Year's Day", 1, 1, observed=FOLLOWING),
+        from_easter('Good Friday', -2),
+        from_easter('Easter Monday', 1),
+        nth_weekday('Early May bank holiday', 5, MONDAY, 1),
+        nth_weekday('Spring bank holiday', 5, MONDAY, -1),
+        nth_weekday('Summer bank holiday', 8, MONDAY, -1),
+        fixed('Christmas Day', 12, 25, observed=FOLLOWING),
+        fixed('Boxing Day', 12, 26, observed=FOLLOWING),
+    ],
+    # The company holidays, e.g. in 2021 Christmas (Saturday) is observed on Thursday the 23rd
+    # since Friday the 24th is already a holiday, and New Year's Day 2022 on Friday, Dec. 31
+    'work': [
+        fixed("New Year's Day", 1, 1),
+        nth_weekday('Martin Luther King Jr. Day', 1, MONDAY, 3),
+        nth_weekday("Presidents' Day", 2, MONDAY, 3),
+        nth_weekday('Memorial Day', 5, MONDAY, -1),
+        fixed('Independence Day', 7, 4),
+        nth_weekday('Labor Day', 9, MONDAY, 1),
+        nth_weekday('Thanksgiving Day', 11, THURSDAY, 4),
+        nth_weekday('Day after Thanksgiving', 11, THURSDAY, 4, offset=1),
+        fixed('Christmas Eve', 12, 24),
+        fixed('Christmas Day', 12, 25),
+        fixed('Day after Christmas', 12, 26),
+    ],
+}
+
+
+def rule_date(rule, year):
+    """Actual date of a rule in year."""
+    if rule.month is None:
+        day = easter(year)
+    elif rule.day is not None:
+        day = date(year, rule.month, rule.day)
+    elif rule.nth > 0:
+        first = date(year, rule.month, 1)
+        day = first + timedelta(days=(rule.weekday - first.weekday()) % 7 + 7 * (rule.nth - 1))
+    else:
+        last = date(year, rule.month, calendar.monthrange(year, rule.month)[1])
+        day = last - timedelta(days=(last.weekday() - rule.weekday) % 7 - 7 * (rule.nth + 1))
+    return day + timedelta(days=rule.offset)
+
+
+def observe(actual_days):
+    """Return [(name, observed date, actual date)] in date order, for a list of (name, actual date, observed policy)."""
+    taken = {day for name, day, policy in actual_days if day.weekday() < SATURDAY or not policy}
+    observed = []
+    for name, day, policy in sorted(actual_days, key=lambda holiday: holiday[1]):
+        moved = day
+        if policy and day.weekday() >= SATURDAY:
+            step = -1 if policy == NEAREST and day.weekday() == SATURDAY else 1
+            moved = day + timedelta(days=step)
+            while moved.weekday() >= SATURDAY or moved in taken:
+                moved += timedelta(days=step)
+            taken.add(moved)
+        observed.append((name, moved, day))
+    return sorted(observed, key=lambda holiday: holiday[1])
+
+
+def expand_region(region, years, rules=None):
+    """Yield the Holidays of a region observed during the given years, in date order."""
+    rules = rule_sets[region] if rules is None else rules
+    years = set(years)
+    # The neighbouring years are expanded too, e.g. a Saturday Jan. 1 is observed on Dec. 31
+    actual_days = [(rule.name, rule_date(rule, year), rule.observed)
+                   for year in range(min(years) - 1, max(years) + 2)
+                   for rule in rules if rule.since is None or year >= rule.since]
+    for name, day, actual in observe(actual_days):
+        if day.year in years:
+            yield Holiday(region, name, day, actual)
+
+
+def expand(regions, years):
+    """Yield the Holidays of every region for the given years, one region after the other."""
+    for region in regions:
+        for holiday in expand_region(region, years):
+            yield holiday
+
+
+# E N D   O F   F I L E #######################################################
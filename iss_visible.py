@@ -5,8 +5,9 @@
 Given a geographic location, determines the optimal viewing times from the ISS (code name ZARYA)
 in the next 10 days between sunset and 10:30 pm, and creates calendar events if they don't already exist.
 
-Uses the skyfield library for astronomical calculations, requires a local copy of the file de440.bsp
-https://rhodesmill.org/skyfield/planets.html#ephemeris-download-links
+Uses the skyfield library for astronomical calculations, the TLE and ephemeris files are cached
+by sky_data.py in the skyfield-data directory. The existing fly-over events are looked up in the
+local calendar mirror (event_mirror.py), which only asks the API for the changes since its last sync.
 
 Assumes that the Google Calendar libraries are installed and configured:
 pip3 install --upgrade google-api-python-client google-auth-httplib2 google-auth-oauthlib
@@ -18,19 +19,22 @@ Source: https://github.com/Christophe-Gauge/Google-Calendar
 
 from __future__ import print_function
 from __future__ import generators
+import os
 import sys
-import pickle
-import os.path
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from skyfield import almanac
-from skyfield.api import Topos, load
-from skyfield.nutationlib import iau2000b
+from concurrent.futures import ProcessPoolExecutor
+from zoneinfo import ZoneInfo
+from calendar_service import get_service
+from calendar_batch import BatchWriter
+from event_mirror import EventMirror
+import metrics
+from sky_data import load_satellites, load_ephemeris, load_timescale
+from pass_prediction import find_passes
+from sun_events import get_sun_table
+from skyfield.api import Topos
 from datetime import datetime, timedelta, time
 from dateutil.parser import parse as dtparse
+from dateutil.tz import UTC
 from tzlocal import get_localzone
-from pytz import timezone
 
 
 __author__ = "Christophe Gauge"
@@ -40,82 +44,97 @@ __license__ = "GNU General Public License v3.0"
 
 # G L O B A L S ###############################################################
 
-# If modifying these scopes, delete the file token.pickle.
-# SCOPES = ['https://www.googleapis.com/auth/calendar.readonly']
-SCOPES = ['https://www.googleapis.com/auth/calendar']
-
 lat, lon = '20.7644 N', '156.4450 W'  # Your location's coordinates K
 elv = 500  # Elevation in meters
-# tzn = 'America/Los_Angeles'  # Your location's timezone if you chose to set it manually
-# timezone = timezone(tzn)
-timezone = get_localzone()  # Get System's timezone 
-print(timezone)
-bed_time = time(hour=23, minute=30, tzinfo=timezone)
+# timezone = ZoneInfo('America/Los_Angeles')  # Your location's timezone if you chose to set it manually
+timezone = None  # None for the system's timezone
+bed_time = time(hour=23, minute=30)  # Observer's local time
 number_of_days_to_process = 10  # We want to see if the ISS will fly over in the next x days
-number_of_calendar_events = 20  # Retrieve x number of calendar events to see if we already have the flyover entries
+shift_tolerance_minutes = 10  # An existing event this close to a predicted pass is that pass, moved
+
+# Each observer gets the fly-over events in its own calendar, 'timezone' defaults to the system's
+observers = [
+    {'name': 'Home', 'lat': lat, 'lon': lon, 'elevation': elv, 'calendarId': 'primary'},
+    # {'name': 'Office', 'lat': '37.4220 N', 'lon': '122.0841 W', 'elevation': 30,
+    #  'calendarId': 'xxxxxxxx@group.calendar.google.com', 'timezone': 'America/Los_Angeles'},
+]
+# Satellite names as they appear in the stations TLE file, and the name used in the event summary
+satellites = {
+    'ISS (ZARYA)': 'ISS',
+    # 'CSS (TIANHE)': 'Tiangong',
+}
+max_workers = None  # Size of the process pool when there are several observers or satellites, None for the CPU count
+use_async_client = False  # Send the new and moved events concurrently with the asyncio client instead of HTTP batches
+
+_sky = None
 
 
 # F U N C T I O N S ###########################################################
 
 
-def Get_calendar_creds():
-    creds = None
-    # The file token.pickle stores the user's access and refresh tokens, and is
-    # created automatically when the authorization flow completes for the first
-    # time.
-    if os.path.exists('token.pickle'):
-        with open('token.pickle', 'rb') as token:
-            creds = pickle.load(token)
-    # If there are no (valid) credentials available, let the user log in.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(
-                'credentials.json', SCOPES)
-            creds = flow.run_local_server(port=0)
-        # Save the credentials for the next run
-        with open('token.pickle', 'wb') as token:
-            pickle.dump(creds, token)
-    return creds
-
-
-def get_calendar_events():
-    """Shows basic usage of the Google Calendar API.
-    Prints the start and name of the next 100 events on the user's calendar.
-    """
-    creds = Get_calendar_creds()
-    service = build('calendar', 'v3', credentials=creds)
+def minute_key(date):
+    """Start time rounded down to the minute, as minutes since the epoch (UTC)."""
+    return int(date.timestamp() // 60)
 
-    # Call the Calendar API
-    now = datetime.utcnow().isoformat() + 'Z' # 'Z' indicates UTC time
-    print(f'Getting the upcoming {number_of_calendar_events} events from the Calendar')
-    events_result = service.events().list(calendarId='primary', timeMin=now,
-                                        maxResults=number_of_calendar_events, singleEvents=True,
-                                        orderBy='startTime').execute()
-    events = events_result.get('items', [])
 
-    return events
+def get_flyover_events(mirror, calendarId, summary, days):
+    """Return {minute_key(start): [events]} of the existing fly-over events in the prediction window.
 
+    The mirror is synced first, the window is then read from its summary index.
+    """
+    mirror.sync(get_service(), calendarId)
+    now = datetime.now(UTC)
+    events = {}
+    for event in mirror.events(calendarId, now, now + timedelta(days=days + 1), summary=summary):
+        if 'dateTime' in event['start']:
+            # Two events may start in the same minute (e.g. a duplicate), each one is kept
+            events.setdefault(minute_key(dtparse(event['start']['dateTime'])), []).append(event)
+    return events
 
-def createEvent(summary, startDate, endDate):
-    # Refer to the Python quickstart on how to setup the environment:
-    # https://developers.google.com/calendar/quickstart/python
-    # Change the scope to 'https://www.googleapis.com/auth/calendar' and delete any
-    # stored credentials.
 
-    creds = Get_calendar_creds()
-    service = build('calendar', 'v3', credentials=creds)
+def find_existing(existing, start_date):
+    """Return (event, shifted) for the existing event of a pass, or (None, False).
 
+    An event starting up to shift_tolerance_minutes away is the same pass whose predicted time
+    has moved since it was created. Matched events are removed from existing.
+    """
+    key = minute_key(start_date)
+    if key in existing:
+        return take(existing, key), False
+    for offset in range(1, shift_tolerance_minutes + 1):
+        for candidate in (key - offset, key + offset):
+            if candidate in existing:
+                return take(existing, candidate), True
+    return None, False
+
+
+def take(existing, key):
+    """Remove and return the first event starting in the minute key."""
+    event = existing[key].pop(0)
+    if not existing[key]:
+        del existing[key]
+    return event
+
+
+def event_created(key, event, exception):
+    if exception is not None:
+        print(f'{key}: ERROR {exception}')
+    else:
+        print(f'{key}: Event created: %s' % (event.get('htmlLink')))
+
+
+def createEvent(writer, summary, startDate, endDate, calendarId='primary', tzname=None):
+    """Queue the creation of a fly-over event, sent in batches by the writer."""
+    tzname = tzname or str(timezone or get_localzone())
     event = {
       'summary': summary,
       'start': {
         'dateTime': startDate,
-        'timeZone': str(timezone),
+        'timeZone': tzname,
       },
       'end': {
         'dateTime': endDate,
-        'timeZone': str(timezone),
+        'timeZone': tzname,
       },
       'reminders': {
         'useDefault': False,
@@ -126,85 +145,127 @@ def createEvent(summary, startDate, endDate):
       },
     }
 
-    event = service.events().insert(calendarId='primary', body=event).execute()
-    print('Event created: %s' % (event.get('htmlLink')))
+    writer.insert(calendarId, event, key=(calendarId, summary, startDate))
 
 
-def main():
-    """Main function."""
-    stations_url = 'http://celestrak.com/NORAD/elements/stations.txt'
-    satellites = load.tle_file(stations_url)
-    print('Loaded', len(satellites), 'satellites')
-    by_name = {sat.name: sat for sat in satellites}
-    planets = load('./de440.bsp')
-
-    by_name = {sat.name: sat for sat in satellites}
-    satellite = by_name['ISS (ZARYA)']
-    print(satellite)
-
-    ts = load.timescale(builtin=True)
-    sun = planets['sun']
-    earth = planets['earth']
-
-    # Let's get the sunset time today at the given location
-    loc = Topos(lat, lon, elevation_m=elv)
-    t0 = ts.utc(datetime.now(timezone))
-    t1 = ts.utc(datetime.now(timezone) + timedelta(days=1))
-    f = almanac.sunrise_sunset(planets, loc)
-    t, y = almanac.find_discrete(t0, t1, f)
-    for ti, yi in zip(t, y):
-        print(ti.astimezone(timezone), 'Rise' if yi else 'Set')
-        if not yi:
-            sunset_time = ti.astimezone(timezone)
-    print(f'Sunset Time: {sunset_time}')
-    print('-'*30)
-
-    # Get the current Google Calendar events so that we can see if we already hav ethe generated events
-    myEvents = get_calendar_events()
-
-    # Let's see is the ISS will be visible and sunlit in the next few days
-    for days in range(0, number_of_days_to_process):
-        try:
-            # Adjust the sunset and bet time dates
-            sunset_today = sunset_time + timedelta(days=days)
-            print(f'Sunset: {sunset_today}')
-            bed_time_today = datetime.combine(sunset_today, bed_time)
-            print(f'Bedtime: {bed_time_today}')
-
-            t0 = ts.from_datetime(sunset_today)
-            t1 = ts.from_datetime(bed_time_today)
-            # print(t0.tt_strftime(), t1.tt_strftime())
-            t, passes = satellite.find_events(loc, t0, t1, altitude_degrees=30.0)
-            is_sunlit = False  # We only want to create an event if the ISS is sunlit and visible
-            for ti, event in zip(t, passes):
-                sunlit = satellite.at(ti).is_sunlit(planets)
-                print(f"{ti.astimezone(timezone)}  {('rise above 30°', 'culminate', 'set below 30°')[event]} is in {'sunlight' if sunlit else 'shadow'}")
-                if sunlit:
-                    is_sunlit = True
-            if is_sunlit and len(t) > 2:
-                # Round the event time to the nearest minute
-                event_start_date = t[0].astimezone(timezone).replace(second=0, microsecond=0)
-                event_end_date = t[2].astimezone(timezone).replace(second=0, microsecond=0)
-                print(event_start_date)
-
-                # Let's see if we already have this event in the calendar
-                already_have_it = False
-                for event in myEvents:
-                    if event['summary'] ==  'ISS Fly-over':
-                        start = event['start'].get('dateTime', event['start'].get('date'))
-                        start_date = dtparse(start).astimezone(timezone)
-                        # print(start_date, event_start_date)
-                        if start_date == event_start_date:
-                            print('  ---> Already have it')
-                            already_have_it = True
-                            break
-                if not already_have_it:
-                    print('creating event')
-                    createEvent('ISS Fly-over', event_start_date.isoformat(), event_end_date.isoformat())
-        except Exception as e:
-            print("ERROR: %s" % e)
+def moveEvent(writer, event, startDate, endDate, calendarId='primary', tzname=None):
+    """Queue the update of an existing fly-over event whose pass time has shifted."""
+    tzname = tzname or str(timezone or get_localzone())
+    times = {
+      'start': {'dateTime': startDate, 'timeZone': tzname},
+      'end': {'dateTime': endDate, 'timeZone': tzname},
+    }
+    writer.patch(calendarId, event['id'], times, key=(calendarId, event['summary'], startDate), etag=event.get('etag'))
 
+
+def observer_timezone(observer):
+    return ZoneInfo(observer['timezone']) if observer.get('timezone') else (timezone or get_localzone())
+
+
+def load_sky(days):
+    """Load the timescale, ephemeris and satellites once per process, shared by all the predictions."""
+    global _sky
+    if _sky is None:
+        # TLEs and ephemeris come from the local cache, refreshed only when stale
+        with metrics.timer('data.satellites'):
+            satellites = load_satellites()
+        print('Loaded', len(satellites), 'satellites')
+        by_name = {sat.name: sat for sat in satellites}
+        with metrics.timer('data.ephemeris'):
+            _sky = (load_timescale(), load_ephemeris(days=days + 2), by_name)
+    return _sky
+
+
+def predict(observer, satellite_name, days, bed_time, tz):
+    """Return (observer name, satellite name, visible passes) for the next days, in the observer's timezone tz.
+
+    Everything is passed explicitly, the module globals are not those of the parent process in a
+    spawned worker.
+    """
+    ts, planets, by_name = load_sky(days)
+    satellite = by_name[satellite_name]
+    loc = Topos(observer['lat'], observer['lon'], elevation_m=observer['elevation'])
+
+    # Let's see if the satellite will be visible and sunlit in the next few days, in one vectorized search
+    now = datetime.now(tz)
+    t0 = ts.from_datetime(now)
+    t1 = ts.from_datetime(now + timedelta(days=days))
+    # Sunsets and twilights are cached per location, shared by all the satellites and later runs
+    with metrics.timer('compute.sun_table'):
+        sun_table = get_sun_table(planets, ts, loc, (observer['lat'], observer['lon'], observer['elevation']), t0, t1)
+    passes = find_passes(satellite, loc, planets, t0, t1, tz, altitude_degrees=30.0,
+                         bed_time=bed_time, sun_table=sun_table)
+    return observer['name'], satellite_name, passes
+
+
+def predict_measured(*task):
+    """predict() in a worker process, also returning the measurements taken there."""
+    return predict(*task), metrics.collect()
+
+
+def predict_all():
+    """Yield the predictions of every observer and satellite, spread over a process pool."""
+    tasks = [(observer, satellite_name, number_of_days_to_process, bed_time, observer_timezone(observer))
+             for observer in observers for satellite_name in satellites]
+    if len(tasks) == 1 or max_workers == 1:
+        for task in tasks:
+            yield predict(*task)
+        return
+    # Each worker process loads the data files once and reuses them for all its tasks
+    with ProcessPoolExecutor(max_workers=min(len(tasks), max_workers or os.cpu_count())) as pool:
+        for result, measurements in pool.map(predict_measured, *zip(*tasks)):
+            metrics.merge(measurements)
+            yield result
+
+
+def update(mirror):
+    """Predict the passes of every observer and satellite, and create or move their events."""
+    by_observer = {observer['name']: observer for observer in observers}
+    # The events we create or move are recorded in the mirror as soon as they are confirmed
+    if use_async_client:
+        from async_calendar import AsyncWriter
+        writer = AsyncWriter(callback=mirror.recorder(event_created))
+    else:
+        writer = BatchWriter(get_service(), callback=mirror.recorder(event_created))
+
+    for observer_name, satellite_name, passes in predict_all():
+        observer = by_observer[observer_name]
+        calendarId = observer.get('calendarId', 'primary')
+        tz = observer_timezone(observer)
+        summary = f'{satellites[satellite_name]} Fly-over'
+        print(f'{observer_name}: {len(passes)} visible passes of {satellite_name} in the next {number_of_days_to_process} days')
+
+        # Get the existing fly-over events once, so that we can see if we already have the generated events
+        existing = get_flyover_events(mirror, calendarId, summary, number_of_days_to_process)
+
+        for sat_pass in passes:
+            print(f"{sat_pass.rise}  rise above 30°, culminate at {sat_pass.culminate}, set below 30° at {sat_pass.set}")
+            # Round the event time to the nearest minute
+            event_start_date = sat_pass.rise.replace(second=0, microsecond=0)
+            event_end_date = sat_pass.set.replace(second=0, microsecond=0)
+
+            # Let's see if we already have this event in the calendar
+            event, shifted = find_existing(existing, event_start_date)
+            if event is not None and not shifted:
+                print('  ---> Already have it')
+            elif event is not None:
+                print(f"  ---> Moving it from {event['start']['dateTime']}")
+                moveEvent(writer, event, event_start_date.isoformat(), event_end_date.isoformat(),
+                          calendarId=calendarId, tzname=str(tz))
+            else:
+                print('creating event')
+                createEvent(writer, summary, event_start_date.isoformat(), event_end_date.isoformat(),
+                            calendarId=calendarId, tzname=str(tz))
         print('-'*30)
+    writer.flush()
+
+
+def main():
+    """Main function."""
+    print(timezone or get_localzone())
+    mirror = EventMirror()
+    update(mirror)
+    mirror.close()
     sys.exit(0)
 
 
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Streaming ingestion and normalization of travel itinerary legs.
+
+Itineraries are read one leg at a time from YAML (single or multi-document), CSV or JSON Lines
+files, so memory use does not depend on the size of the file (a .json file holding an array of
+flights is parsed as a whole). Each departure and arrival time
+is parsed once and attached to the timezone of its airport, resolved through a memoized
+zoneinfo cache. The resulting Leg records carry timezone-aware
+datetimes, so durations are computed across timezones without LMT offsets.
+
+Source: https://github.com/Christophe-Gauge/Google-Calendar
+'''
+
+# I M P O R T S ###############################################################
+
+import csv
+import json
+from collections import namedtuple
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+from dateutil import parser
+import yaml
+
+
+__author__ = "Christophe Gauge"
+__version__ = "1.0.1"
+__license__ = "GNU General Public License v3.0"
+
+
+# G L O B A L S ###############################################################
+
+Leg = namedtuple('Leg', ['name', 'confirmation',
+                         'origin', 'origin_airport', 'departure',
+                         'destination', 'destination_airport', 'arrival'])
+
+# Column names of flat CSV / JSON Lines records
+flat_fields = ['name', 'departure_airport', 'departure_time', 'arrival_airport', 'arrival_time', 'confirmation']
+
+
+# F U N C T I O N S ###########################################################
+
+
+@lru_cache(maxsize=1024)
+def get_zone(name):
+    """Return the ZoneInfo for an IANA timezone name, created only once per name."""
+    return ZoneInfo(name)
+
+
+def text(value, field):
+    """Return a field as a stripped string (YAML may load it as a number or a bool), KeyError if it is missing."""
+    if value is None:
+        raise KeyError(field)
+    return str(value).strip()
+
+
+def local_time(time, airport):
+    """Parse a local time string and attach the timezone of the airport."""
+    if not hasattr(time, 'tzinfo'):
+        time = parser.parse(text(time, 'time'))
+    if time.tzinfo is not None:
+        # Already has an offset: keep the instant, expressed in the airport's timezone
+        return time.astimezone(get_zone(airport.timezone))
+    # zoneinfo resolves the correct UTC offset for that date, unlike pytz with replace()
+    return time.replace(tzinfo=get_zone(airport.timezone))
+
+
+def normalize_leg(flight, airports):
+    """Turn a flight dict from the itinerary file into a Leg."""
+    origin = text(flight['departure']['airport'], 'airport').upper()
+    destination = text(flight['arrival']['airport'], 'airport').upper()
+    origin_airport = airports[origin]
+    destination_airport = airports[destination]
+    return Leg(name=str(flight['name']).strip(),
+               confirmation=str(flight.get('confirmation', '')).strip(),
+               origin=origin,
+               origin_airport=origin_airport,
+               departure=local_time(flight['departure']['time'], origin_airport),
+               destination=destination,
+               destination_airport=destination_airport,
+               arrival=local_time(flight['arrival']['time'], destination_airport))
+
+
+def from_flat(row):
+    """Convert a flat CSV / JSON Lines record to the nested format of the YAML itinerary."""
+    return {
+        'name': row['name'],
+        'departure': {'airport': row['departure_airport'], 'time': row['departure_time']},
+        'arrival': {'airport': row['arrival_airport'], 'time': row['arrival_time']},
+        'confirmation': row.get('confirmation') or '',
+    }
+
+
+def read_yaml(stream):
+    """Yield flights from YAML documents, each one being a flight or a list of flights."""
+    for document in yaml.safe_load_all(stream):
+        if document is None:
+            continue
+        if isinstance(document, dict):
+            document = [document]
+        for flight in document:
+            yield flight
+
+
+def read_csv(stream):
+    """Yield flights from a CSV file with a header row using the flat_fields column names."""
+    for row in csv.DictReader(stream):
+        yield from_flat(row)
+
+
+def read_jsonl(stream):
+    """Yield flights from JSON Lines, in either the nested or the flat format."""
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def read_json(stream):
+    """Yield flights from a JSON file holding an array of flights (or a single flight)."""
+    document = json.load(stream)
+    for flight in [document] if isinstance(document, dict) else document:
+        yield flight
+
+
+def read_flights(filename):
+    """Yield the flights of an itinerary file, one at a time, based on its extension."""
+    if filename.endswith('.csv'):
+        reader = read_csv
+    elif filename.endswith(('.jsonl', '.ndjson')):
+        reader = read_jsonl
+    elif filename.endswith('.json'):
+        reader = read_json
+    else:
+        reader = read_yaml
+    with open(filename, newline='', encoding='utf-8') as stream:
+        for flight in reader(stream):
+            yield flight
+
+
+def normalize_legs(flights, airports):
+    """Yield a Leg for each valid flight, in the nested or the flat format, reporting and skipping the invalid ones."""
+    for number, flight in enumerate(flights, 1):
+        if not isinstance(flight, dict):
+            print(f'Skipping leg #{number}: not a flight record ({type(flight).__name__})')
+            continue
+        try:
+            yield normalize_leg(flight if 'departure' in flight else from_flat(flight), airports)
+        except KeyError as e:
+            print(f'Skipping leg #{number} {flight.get("name")}: unknown airport or missing field {e}')
+        except (ValueError, OverflowError) as e:
+            print(f'Skipping leg #{number} {flight.get("name")}: {e}')
+        except (AttributeError, TypeError) as e:
+            # e.g. a null departure, or a truncated CSV row
+            print(f'Skipping leg #{number} {flight.get("name")}: malformed record ({e})')
+
+
+def duration(leg):
+    """Return the (hours, minutes) flight time of a Leg."""
+    minutes = int((leg.arrival - leg.departure).total_seconds()) // 60
+    return minutes // 60, minutes % 60
+
+
+# E N D   O F   F I L E #######################################################
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Write-ahead journal of the API operations of a bulk job, so that an interrupted run can resume.
+
+Each operation is appended to <job>.journal when it is planned, before it is sent, and again
+when it completes, with the id of the event it created or changed. The records are JSON lines,
+and the file is fsync'd in groups (every group_size records or group_seconds, and before each
+batch is sent), not once per record. A run that dies halfway (token expiry, quota, crash) leaves
+the journal behind: the next run of the same job reads it and skips the operations recorded as
+done, and only the remaining work is sent again. A failed operation is final for the journal,
+the next run retries it only if it plans it again. A run that completes removes its journal,
+unless some of the operations it planned failed or never completed. A recurring job (e.g. the
+reminders, that must look at every event again on the next run) always removes it.
+
+journal = JobJournal('flights')
+writer = BatchWriter(service, callback=journal.recorder(callback), before_send=journal.sync)
+for key, event in events:
+    if not journal.is_done(key):
+        journal.plan(key, 'insert')
+        writer.insert(calendarId, event, key=key)
+writer.flush()
+journal.finish()
+
+Source: https://github.com/Christophe-Gauge/Google-Calendar
+'''
+
+# I M P O R T S ###############################################################
+
+import json
+import os
+import time
+import metrics
+from event_index import is_duplicate
+
+
+__author__ = "Christophe Gauge"
+__version__ = "1.0.1"
+__license__ = "GNU General Public License v3.0"
+
+
+# G L O B A L S ###############################################################
+
+journal_directory = '.'
+group_size = 500  # Records appended between two fsyncs, at most
+group_seconds = 1.0  # Seconds between two fsyncs, at most
+
+
+# F U N C T I O N S ###########################################################
+
+
+def record_key(key):
+    """Keys are tuples in memory and lists in JSON."""
+    return tuple(key) if isinstance(key, (list, tuple)) else key
+
+
+class JobJournal(object):
+    """Append-only log of the planned and completed operations of a job."""
+
+    def __init__(self, job, directory=None, recurring=False):
+        self.job = job
+        self.recurring = recurring
+        self.filename = os.path.join(directory or journal_directory, f'{job}.journal')
+        self.done = {}  # key: event id, of the operations completed by this run or an interrupted one
+        self.in_flight = set()  # Planned, not completed nor failed yet
+        self.planned = set()  # Planned by this run
+        self.failed = set()  # Failed during this run
+        self.resumed = os.path.exists(self.filename)
+        if self.resumed:
+            self._load()
+            print(f'Resuming {job}: {len(self.done)} operations already done, {len(self.in_flight)} to send again')
+        self.file = open(self.filename, 'a', encoding='utf-8')
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.finish()
+        else:
+            self.close()
+
+    def _load(self):
+        with open(self.filename, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last line may have been cut by the crash
+                    break
+                key = record_key(record['key'])
+                if record['state'] == 'plan':
+                    self.in_flight.add(key)
+                elif record['state'] == 'done':
+                    self.in_flight.discard(key)
+                    self.done[key] = record.get('id')
+                elif record['state'] == 'fail':
+                    self.in_flight.discard(key)
+
+    def _append(self, record):
+        self.file.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self.unsynced += 1
+        if self.unsynced >= group_size or time.monotonic() - self.synced_at >= group_seconds:
+            self.sync()
+
+    def sync(self):
+        """Make the records appended so far durable."""
+        if self.unsynced:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            metrics.count('journal.fsyncs')
+            self.unsynced = 0
+        self.synced_at = time.monotonic()
+
+    def is_done(self, key):
+        return record_key(key) in self.done
+
+    def plan(self, key, operation):
+        """Record an operation about to be queued."""
+        key = record_key(key)
+        self.in_flight.add(key)
+        self.planned.add(key)
+        self.failed.discard(key)
+        self._append({'state': 'plan', 'key': key, 'op': operation})
+
+    def complete(self, key, event_id=None):
+        key = record_key(key)
+        self.in_flight.discard(key)
+        self.done[key] = event_id
+        self._append({'state': 'done', 'key': key, 'id': event_id})
+
+    def fail(self, key, exception):
+        key = record_key(key)
+        self.in_flight.discard(key)
+        self.failed.add(key)
+        self._append({'state': 'fail', 'key': key, 'error': str(exception)})
+
+    def recorder(self, callback=None):
+        """Return a BatchWriter callback recording the outcome of each operation, then calling callback.
+
+        An insert rejected as a duplicate (409) counts as done, the event is already there.
+        """
+        def record(key, event, exception):
+            if exception is None:
+                self.complete(key, event.get('id') if event else None)
+            elif is_duplicate(exception):
+                self.complete(key)
+            else:
+                self.fail(key, exception)
+            if callback is not None:
+                callback(key, event, exception)
+        return record
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+    def finish(self):
+        """Close the journal, and remove it if every operation planned by this run completed."""
+        self.close()
+        unfinished = self.planned & self.in_flight
+        if (self.failed or unfinished) and not self.recurring:
+            print(f'{self.job}: {len(self.failed)} failed and {len(unfinished)} unfinished operations, '
+                  f'run again to retry them ({self.filename})')
+        else:
+            os.remove(self.filename)
+
+
+# E N D   O F   F I L E #######################################################
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Lightweight timers and counters for the hot paths of the scripts, with a report per run.
+
+Instrumentation is off unless the GCAL_METRICS environment variable names a report file:
+a Prometheus textfile if it ends with .prom, JSON otherwise, '-' for JSON on stderr.
+GCAL_METRICS=reminders.prom ./calendar_reminders.py
+
+When it is off, timer() returns a shared no-op context manager and count() returns at once,
+so the instrumented code runs at the same speed.
+
+Timers (count, total and max seconds): credentials.load, credentials.refresh, discovery,
+service.build, api.<method id> (each attempt), compute.* and data.* stages.
+Counters: api.calls, api.retries, api.throttled, bytes.sent, bytes.received, events.read,
+events.written, events.failed.
+
+Source: https://github.com/Christophe-Gauge/Google-Calendar
+'''
+
+# I M P O R T S ###############################################################
+
+import atexit
+import contextlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+
+__author__ = "Christophe Gauge"
+__version__ = "1.0.1"
+__license__ = "GNU General Public License v3.0"
+
+
+# G L O B A L S ###############################################################
+
+report_file = os.environ.get('GCAL_METRICS')
+enabled = bool(report_file)
+job = os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0] or 'python'
+
+timings = {}  # name: [count, total seconds, max seconds]
+counters = Counter()
+
+_lock = threading.Lock()
+_started = time.time()
+_disabled = contextlib.nullcontext()
+
+
+# F U N C T I O N S ###########################################################
+
+
+class _Timer(object):
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, time.perf_counter() - self.start)
+
+
+def timer(name):
+    """Context manager timing the enclosed block under name (a no-op when disabled)."""
+    return _Timer(name) if enabled else _disabled
+
+
+def record(name, seconds):
+    with _lock:
+        stat = timings.get(name)
+        if stat is None:
+            timings[name] = [1, seconds, seconds]
+        else:
+            stat[0] += 1
+            stat[1] += seconds
+            stat[2] = max(stat[2], seconds)
+
+
+def count(name, value=1):
+    """Add value to the counter name."""
+    if enabled:
+        with _lock:
+            counters[name] += value
+
+
+def collect(reset=True):
+    """Return the measurements taken so far, e.g. to send them from a worker process to merge()."""
+    with _lock:
+        snapshot = {'timings': {name: list(stat) for name, stat in timings.items()}, 'counters': dict(counters)}
+        if reset:
+            timings.clear()
+            counters.clear()
+    return snapshot
+
+
+def merge(snapshot):
+    """Add the measurements of another process."""
+    with _lock:
+        for name, (calls, seconds, longest) in snapshot['timings'].items():
+            stat = timings.setdefault(name, [0, 0.0, 0.0])
+            stat[0] += calls
+            stat[1] += seconds
+            stat[2] = max(stat[2], longest)
+        counters.update(snapshot['counters'])
+
+
+def report():
+    """Return the run report as a dict."""
+    snapshot = collect(reset=False)
+    return {
+        'job': job,
+        'started': _started,
+        'seconds': time.time() - _started,
+        'timings': {name: {'count': calls, 'seconds': seconds, 'max_seconds': longest}
+                    for name, (calls, seconds, longest) in sorted(snapshot['timings'].items())},
+        'counters': dict(sorted(snapshot['counters'].items())),
+    }
+
+
+def to_prometheus(data):
+    """Format a report in the Prometheus text exposition format (for the node exporter textfile collector)."""
+    labels = f'job="{data["job"]}"'
+    lines = ['# TYPE gcal_run_timestamp_seconds gauge',
+             f'gcal_run_timestamp_seconds{{{labels}}} {data["started"]:.3f}',
+             '# TYPE gcal_run_duration_seconds gauge',
+             f'gcal_run_duration_seconds{{{labels}}} {data["seconds"]:.6f}']
+    for metric, field, kind in (('gcal_stage_calls_total', 'count', 'counter'),
+                                ('gcal_stage_seconds_total', 'seconds', 'counter'),
+                                ('gcal_stage_max_seconds', 'max_seconds', 'gauge')):
+        lines.append(f'# TYPE {metric} {kind}')
+        for name, stat in data['timings'].items():
+            lines.append(f'{metric}{{{labels},stage="{name}"}} {stat[field]:g}')
+    for name, value in data['counters'].items():
+        metric = 'gcal_' + re.sub(r'[^a-zA-Z0-9_]', '_', name) + '_total'
+        lines.append(f'# TYPE {metric} counter')
+        lines.append(f'{metric}{{{labels}}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_report(filename=None):
+    """Write the run report to filename (report_file by default)."""
+    filename = filename or report_file
+    data = report()
+    text = to_prometheus(data) if filename.endswith('.prom') else json.dumps(data, indent=2) + '\n'
+    if filename == '-':
+        sys.stderr.write(text)
+        return
+    tmp_file = filename + '.tmp'
+    with open(tmp_file, 'w') as f:
+        f.write(text)
+    os.replace(tmp_file, filename)
+
+
+if enabled:
+    atexit.register(write_report)
+
+
+# E N D   O F   F I L E #######################################################
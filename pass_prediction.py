@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Vectorized satellite pass prediction.
+
+A single skyfield find_events() call covers the whole horizon. The sunlit state of the
+satellite and the altitude of the sun at the observer are then computed for every event time
+in one array operation each, and passes are selected with NumPy masks, so predicting a year
+ahead costs about the same as predicting a few days.
+
+Requires:
+pip3 install skyfield
+
+Source: https://github.com/Christophe-Gauge/Google-Calendar
+'''
+
+# I M P O R T S ###############################################################
+
+from collections import namedtuple
+from datetime import time
+import numpy as np
+import metrics
+
+
+__author__ = "Christophe Gauge"
+__version__ = "1.0.1"
+__license__ = "GNU General Public License v3.0"
+
+
+# G L O B A L S ###############################################################
+
+RISE, CULMINATE, SET = 0, 1, 2
+sunset_altitude = -0.8333  # Sun altitude in degrees at sunset, accounting for refraction
+
+Pass = namedtuple('Pass', ['rise', 'culminate', 'set', 'sunlit'])
+
+
+# F U N C T I O N S ###########################################################
+
+
+def complete_passes(events):
+    """Return the indexes of the rise events directly followed by a culmination and a set."""
+    rises = np.flatnonzero(events[:-2] == RISE)
+    return rises[(events[rises + 1] == CULMINATE) & (events[rises + 2] == SET)]
+
+
+def sun_altitudes(ephemeris, observer, t):
+    """Altitude in degrees of the sun at the observer, for every time of t."""
+    with metrics.timer('compute.sun_altitudes'):
+        apparent = (ephemeris['earth'] + observer).at(t).observe(ephemeris['sun']).apparent()
+        return apparent.altaz()[0].degrees
+
+
+def find_passes(satellite, observer, ephemeris, t0, t1, timezone, altitude_degrees=30.0,
+                evening_start=time(hour=12), bed_time=time(hour=23, minute=30), sun_table=None):
+    """Return the visible passes of satellite between t0 and t1.
+
+    A pass is kept when it rises above altitude_degrees and sets again within the search
+    window, when the satellite is sunlit at one of its rise, culmination or set times, when the
+    sun is already set for the observer at rise time, and when it rises in the evening between
+    evening_start and bed_time, local time.
+    If a sun_events.SunTable of the observer is given, darkness is looked up in it instead of
+    computing the position of the sun.
+    """
+    with metrics.timer('compute.find_events'):
+        t, events = satellite.find_events(observer, t0, t1, altitude_degrees=altitude_degrees)
+    if len(events) < 3:
+        return []
+
+    rises = complete_passes(events)
+    if len(rises) == 0:
+        return []
+
+    with metrics.timer('compute.is_sunlit'):
+        sunlit = satellite.at(t).is_sunlit(ephemeris)
+    if sun_table is not None:
+        dark = sun_table.is_dark(t[rises])
+    else:
+        dark = sun_altitudes(ephemeris, observer, t[rises]) < sunset_altitude
+    visible = (sunlit[rises] | sunlit[rises + 1] | sunlit[rises + 2]) & dark
+
+    passes = []
+    for index in rises[visible]:
+        rise = t[index].astimezone(timezone)
+        if evening_start <= rise.time() <= bed_time:
+            passes.append(Pass(rise, t[index + 1].astimezone(timezone), t[index + 2].astimezone(timezone),
+                               bool(sunlit[index] & sunlit[index + 1] & sunlit[index + 2])))
+    return passes
+
+
+# E N D   O F   F I L E #######################################################
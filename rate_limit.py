@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Quota-aware execution of Google Calendar API requests.
+
+Every request goes through execute(), which:
+- takes tokens from a token bucket sized to the project quota (requests_per_second, burst),
+- retries 429, 5xx and 403 rateLimitExceeded / userRateLimitExceeded answers, as well as
+  transport errors, with jittered exponential backoff (honoring Retry-After when present).
+  A request lost on the way (timeout, connection reset) may still have been processed, so it
+  is only sent again if it is idempotent: never an insert, a patch or a batch, unless the
+  connection was refused. The daily quota (quotaExceeded) is not retried, waiting won't help.
+
+AIMDLimiter adapts the number of requests in flight for the parallel paths: it grows by one
+after a full window of successes and halves when the server starts throttling.
+
+Assumes that the Google Calendar libraries are installed and configured:
+pip3 install --upgrade google-api-python-client google-auth-httplib2 google-auth-oauthlib
+
+Source: https://github.com/Christophe-Gauge/Google-Calendar
+'''
+
+# I M P O R T S ###############################################################
+
+import random
+import threading
+import time
+from googleapiclient.errors import HttpError
+import metrics
+
+
+__author__ = "Christophe Gauge"
+__version__ = "1.0.1"
+__license__ = "GNU General Public License v3.0"
+
+
+# G L O B A L S ###############################################################
+
+# The Calendar API default quota is 600 queries per minute per user, adjust to your project's quota
+requests_per_second = 10.0
+burst = 20
+max_retries = 6
+backoff_base = 1.0  # Seconds
+backoff_cap = 64.0  # Seconds
+
+retry_status = (429, 500, 502, 503, 504)
+retry_reasons = ('rateLimitExceeded', 'userRateLimitExceeded', 'backendError')
+idempotent_methods = ('GET', 'HEAD', 'PUT', 'DELETE')  # Safe to send again if the answer was lost
+
+
+# F U N C T I O N S ###########################################################
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket, refilled at rate tokens per second up to capacity."""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def delay(self, tokens=1):
+        """Take tokens, return how long to wait before using them."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self, tokens=1):
+        wait = self.delay(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+
+class AIMDLimiter(object):
+    """Additive increase / multiplicative decrease limit of concurrent requests."""
+
+    def __init__(self, initial=4, minimum=1, maximum=64):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.successes = 0
+        self.lock = threading.Lock()
+
+    def success(self):
+        with self.lock:
+            self.successes += 1
+            if self.successes >= self.limit:
+                self.successes = 0
+                self.limit = min(self.maximum, self.limit + 1)
+
+    def throttled(self):
+        with self.lock:
+            self.successes = 0
+            self.limit = max(self.minimum, self.limit // 2)
+
+
+bucket = TokenBucket(requests_per_second, burst)
+
+
+def is_throttled(exception):
+    """True if the server asks us to slow down."""
+    if not isinstance(exception, HttpError):
+        return False
+    status = exception.resp.status
+    if status == 403:
+        return any(reason in str(exception.content) for reason in retry_reasons)
+    return status == 429
+
+
+def is_retryable(exception, method='GET'):
+    """True if a failed request of the given HTTP method is worth sending again."""
+    if isinstance(exception, HttpError):
+        return is_throttled(exception) or exception.resp.status in retry_status
+    if isinstance(exception, ConnectionRefusedError):
+        # The request never left
+        return True
+    return isinstance(exception, (ConnectionError, TimeoutError)) and method in idempotent_methods
+
+
+def backoff(attempt, exception=None):
+    """Seconds to wait before the given retry attempt (1, 2...), with full jitter."""
+    resp = getattr(exception, 'resp', None)
+    retry_after = resp.get('retry-after') if resp is not None else None
+    if retry_after and str(retry_after).isdigit():
+        return float(retry_after) + random.random()
+    return random.uniform(0, min(backoff_cap, backoff_base * 2 ** attempt))
+
+
+def execute(request, cost=1, retries=None, limiter=None):
+    """Execute an HttpRequest (or BatchHttpRequest) within the quota, retrying transient errors.
+
+    cost is the number of quota units used, e.g. the number of calls in a batch. If an
+    AIMDLimiter is given it is told about successes and throttling.
+    """
+    retries = max_retries if retries is None else retries
+    name = 'api.' + (getattr(request, 'methodId', None) or 'batch')
+    # A BatchHttpRequest is a POST
+    method = getattr(request, 'method', 'POST')
+    attempt = 0
+    while True:
+        bucket.acquire(cost)
+        metrics.count('api.calls', cost)
+        try:
+            with metrics.timer(name):
+                response = request.execute()
+        except Exception as e:
+            if not is_retryable(e, method) or attempt >= retries:
+                raise
+            if is_throttled(e):
+                metrics.count('api.throttled')
+                if limiter is not None:
+                    limiter.throttled()
+            metrics.count('api.retries')
+            attempt += 1
+            delay = backoff(attempt, e)
+            print(f'Request failed ({e}), retry {attempt}/{retries} in {delay:.1f}s')
+            time.sleep(delay)
+            continue
+        if limiter is not None:
+            limiter.success()
+        return response
+
+
+# E N D   O F   F I L E #######################################################
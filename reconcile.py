@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Reconciliation of the events a script wants in a calendar with the events already there.
+
+The events managed by a job are tagged with two private extended properties: the job scope and
+a key identifying each event within the job. The existing events of the scope are read with one
+paginated, field-masked events.list, compared by key with the desired events, and only the
+differences are written, in batches:
+- desired events that do not exist are inserted,
+- existing events that differ are patched with only the fields that changed,
+- existing events that are no longer desired are deleted.
+A desired event that is not in the scope yet, but matches an untagged event of the calendar by
+start and summary (e.g. created before the job used reconciliation), adopts that event: it is
+patched with the tags instead of being inserted again.
+
+Assumes that the Google Calendar libraries are installed and configured:
+pip3 install --upgrade google-api-python-client google-auth-httplib2 google-auth-oauthlib
+
+Source: https://github.com/Christophe-Gauge/Google-Calendar
+'''
+
+# I M P O R T S ###############################################################
+
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from dateutil.parser import parse as dtparse
+from calendar_batch import BatchWriter
+from calendar_sync import list_events
+
+
+__author__ = "Christophe Gauge"
+__version__ = "1.0.1"
+__license__ = "GNU General Public License v3.0"
+
+
+# G L O B A L S ###############################################################
+
+scope_property = 'gcal_scope'
+key_property = 'gcal_key'
+compared_fields = ('summary', 'description', 'location', 'start', 'end', 'reminders')
+list_fields = 'nextPageToken,items(id,etag,status,summary,description,location,start,end,reminders,extendedProperties)'
+
+Changeset = namedtuple('Changeset', ['inserts', 'patches', 'deletes'])
+
+
+# F U N C T I O N S ###########################################################
+
+
+def tag(event, scope, key):
+    """Add the scope and key private properties to a desired event."""
+    properties = event.setdefault('extendedProperties', {}).setdefault('private', {})
+    properties[scope_property] = scope
+    properties[key_property] = key
+    return event
+
+
+def event_key(event):
+    return event.get('extendedProperties', {}).get('private', {}).get(key_property)
+
+
+def normalize_time(value):
+    """Comparable form of an event start or end: a date, or an aware datetime."""
+    if value is None:
+        return None
+    if 'date' in value and 'dateTime' not in value:
+        return ('date', value['date'])
+    moment = dtparse(value['dateTime'])
+    if moment.tzinfo is None and value.get('timeZone'):
+        moment = moment.replace(tzinfo=ZoneInfo(value['timeZone']))
+    return ('dateTime', moment)
+
+
+def normalize_reminders(value):
+    if value is None:
+        return None
+    overrides = frozenset((override['method'], override['minutes']) for override in value.get('overrides', []))
+    return (value.get('useDefault', False), overrides)
+
+
+def normalize(field, value):
+    if field in ('start', 'end'):
+        return normalize_time(value)
+    if field == 'reminders':
+        return normalize_reminders(value)
+    return value or None
+
+
+def changed_fields(desired, current):
+    """Return the fields of desired whose value differs from the current event."""
+    return {field: desired[field] for field in compared_fields
+            if field in desired and normalize(field, desired[field]) != normalize(field, current.get(field))}
+
+
+def fetch_existing(service, calendarId, scope, **kwargs):
+    """Return {key: event} of the existing events of a scope, read in one paginated list."""
+    existing = {}
+    for event in list_events(service, calendarId, privateExtendedProperty=f'{scope_property}={scope}',
+                             fields=list_fields, **kwargs):
+        key = event_key(event)
+        if key is not None and event.get('status') != 'cancelled':
+            existing[key] = event
+    return existing
+
+
+def time_range(events):
+    """(timeMin, timeMax) around the starts and ends of events, with a day of margin for all-day events."""
+    moments = []
+    for event in events:
+        for value in (event['start'], event.get('end', event['start'])):
+            kind, moment = normalize_time(value)
+            if kind == 'date':
+                moment = datetime.fromisoformat(moment).replace(tzinfo=timezone.utc)
+            elif moment.tzinfo is None:
+                moment = moment.replace(tzinfo=timezone.utc)
+            moments.append(moment)
+    return (min(moments) - timedelta(days=1)).isoformat(), (max(moments) + timedelta(days=1)).isoformat()
+
+
+def adopt_untagged(service, calendarId, changeset, **kwargs):
+    """Turn the inserts matching an untagged event by start and summary into patches tagging that event."""
+    if not changeset.inserts:
+        return changeset
+    timeMin, timeMax = time_range(event for key, event in changeset.inserts)
+    untagged = {}
+    for event in list_events(service, calendarId, timeMin=timeMin, timeMax=timeMax, singleEvents=True,
+                             fields=list_fields, **kwargs):
+        if event_key(event) is None and event.get('status') != 'cancelled':
+            untagged.setdefault((normalize_time(event['start']), event.get('summary')), event)
+    inserts, patches = [], list(changeset.patches)
+    for key, event in changeset.inserts:
+        current = untagged.pop((normalize_time(event['start']), event.get('summary')), None)
+        if current is None:
+            inserts.append((key, event))
+        else:
+            fields = changed_fields(event, current)
+            fields['extendedProperties'] = event['extendedProperties']
+            patches.append((key, current, fields))
+    return Changeset(inserts, patches, changeset.deletes)
+
+
+def compute_changes(desired, existing, delete_stale=True):
+    """Return the minimal Changeset turning the existing events into the desired ones.
+
+    desired and existing are both {key: event}.
+    """
+    inserts, patches, deletes = [], [], []
+    for key, event in desired.items():
+        current = existing.get(key)
+        if current is None:
+            inserts.append((key, event))
+        else:
+            fields = changed_fields(event, current)
+            if fields:
+                patches.append((key, current, fields))
+    if delete_stale:
+        deletes = [(key, event) for key, event in existing.items() if key not in desired]
+    return Changeset(inserts, patches, deletes)
+
+
+def apply_changes(writer, calendarId, changeset):
+    """Queue the writes of a Changeset, keys are ('insert' | 'patch' | 'delete', key)."""
+    for key, event in changeset.inserts:
+        writer.insert(calendarId, event, key=('insert', key))
+    for key, current, fields in changeset.patches:
+        writer.patch(calendarId, current['id'], fields, key=('patch', key), etag=current.get('etag'))
+    for key, current in changeset.deletes:
+        writer.delete(calendarId, current['id'], key=('delete', key), etag=current.get('etag'))
+
+
+def reconcile(service, calendarId, scope, desired, delete_stale=True, callback=None, writer=None, adopt=True,
+              **list_kwargs):
+    """Bring the events of a scope in line with desired ({key: event}), return the Changeset.
+
+    The writes go through writer if given, to group the changes of several scopes in the same
+    batches (flushing it is then up to the caller), or through a new BatchWriter. With adopt,
+    untagged events matching a missing one are tagged instead of inserting a duplicate, at the
+    cost of one more list call when something is missing.
+    """
+    for key, event in desired.items():
+        tag(event, scope, key)
+    changeset = compute_changes(desired, fetch_existing(service, calendarId, scope, **list_kwargs), delete_stale)
+    if adopt:
+        changeset = adopt_untagged(service, calendarId, changeset, **list_kwargs)
+    print(f'{scope}: {len(changeset.inserts)} to insert, {len(changeset.patches)} to update, '
+          f'{len(changeset.deletes)} to delete, {len(desired) - len(changeset.inserts) - len(changeset.patches)} unchanged')
+    if writer is not None:
+        apply_changes(writer, calendarId, changeset)
+        return changeset
+    with BatchWriter(service, callback=callback) as writer:
+        apply_changes(writer, calendarId, changeset)
+    return changeset
+
+
+# E N D   O F   F I L E #######################################################
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Declarative reminder policies: which reminders an event should have.
+
+A policy is an ordered list of rules, the first rule matching an event gives its reminders.
+Each rule is a dict (e.g. loaded from a YAML file) with optional conditions:
+- calendars: list of calendarIds the rule applies to (all calendars if missing),
+- all_day: True for all-day events only, False for timed events only (both if missing),
+- summary: regular expression searched in the event summary,
+- min_minutes / max_minutes: bounds of the event duration,
+- min_attendees / max_attendees: bounds of the number of attendees,
+and the reminders to set: a list of {'method': 'popup' or 'email', 'minutes': n}, 'default' for
+the calendar's default reminders, or None to leave the matched events alone.
+
+An event already having at least the reminders of its rule (other reminders added by hand are
+fine) is left alone, otherwise its reminders are replaced by the ones of the rule.
+
+The rules are compiled once: regular expressions are precompiled, the reminders are kept as a
+frozenset of (method, minutes) to compare with an event's overrides, and the rules are bucketed
+by calendar and event kind, so an event is only tested against the rules that can apply to it.
+
+Source: https://github.com/Christophe-Gauge/Google-Calendar
+'''
+
+# I M P O R T S ###############################################################
+
+import re
+from datetime import date, datetime
+import yaml
+
+
+__author__ = "Christophe Gauge"
+__version__ = "1.0.1"
+__license__ = "GNU General Public License v3.0"
+
+
+# G L O B A L S ###############################################################
+
+conditions = ('calendars', 'all_day', 'summary', 'min_minutes', 'max_minutes', 'min_attendees', 'max_attendees')
+
+
+# F U N C T I O N S ###########################################################
+
+
+def load_rules(filename):
+    """Return the list of rules of a YAML (or JSON) file, either a list or a dict with a 'rules' list."""
+    with open(filename) as f:
+        rules = yaml.safe_load(f)
+    return rules['rules'] if isinstance(rules, dict) else rules
+
+
+def duration_minutes(event):
+    """Duration of an event in minutes, all-day events last 1440 minutes per day."""
+    start, end = event['start'], event.get('end', event['start'])
+    if 'date' in start:
+        return (date.fromisoformat(end['date']) - date.fromisoformat(start['date'])).days * 1440
+    started = datetime.fromisoformat(start['dateTime'].replace('Z', '+00:00'))
+    ended = datetime.fromisoformat(end['dateTime'].replace('Z', '+00:00'))
+    return (ended - started).total_seconds() / 60
+
+
+def reminders_key(reminders):
+    """(useDefault, frozenset of (method, minutes)) of an event's or a rule's reminders."""
+    if not reminders or reminders.get('useDefault', True):
+        return True, frozenset()
+    return False, frozenset((override['method'], override['minutes']) for override in reminders.get('overrides', []))
+
+
+class Rule(object):
+    """A compiled rule."""
+
+    def __init__(self, order, rule):
+        unknown = set(rule) - set(conditions) - {'name', 'reminders'}
+        if unknown:
+            raise ValueError(f"Unknown keys in reminder rule {rule.get('name', order)}: {', '.join(sorted(unknown))}")
+        self.order = order
+        self.name = rule.get('name', f'rule {order + 1}')
+        self.calendars = rule.get('calendars')
+        self.all_day = rule.get('all_day')
+        self.summary = re.compile(rule['summary']) if rule.get('summary') else None
+        self.minutes = (rule.get('min_minutes'), rule.get('max_minutes'))
+        self.attendees = (rule.get('min_attendees'), rule.get('max_attendees'))
+        reminders = rule.get('reminders')
+        if reminders is None:
+            self.reminders = None
+        elif reminders == 'default':
+            # events.patch merges objects, the overrides must be emptied explicitly
+            self.reminders = {'useDefault': True, 'overrides': []}
+        else:
+            overrides = [{'method': override['method'], 'minutes': int(override['minutes'])} for override in reminders]
+            self.reminders = {'useDefault': False, 'overrides': overrides}
+        self.key = reminders_key(self.reminders) if self.reminders else None
+
+    def matches(self, event):
+        """Test the conditions not already implied by the bucket of the rule, cheapest first."""
+        if self.summary is not None and not self.summary.search(event.get('summary', '')):
+            return False
+        if self.attendees != (None, None) and not within(len(event.get('attendees', ())), self.attendees):
+            return False
+        if self.minutes != (None, None) and not within(duration_minutes(event), self.minutes):
+            return False
+        return True
+
+
+def within(value, bounds):
+    low, high = bounds
+    return (low is None or value >= low) and (high is None or value <= high)
+
+
+class Policy(object):
+    """Compiled list of rules, evaluated first match wins."""
+
+    def __init__(self, rules):
+        self.rules = [Rule(order, rule) for order, rule in enumerate(rules)]
+        # Rules by (calendarId or None for any calendar, all_day or None for any kind of event)
+        self.buckets = {}
+        for rule in self.rules:
+            for calendarId in rule.calendars or [None]:
+                self.buckets.setdefault((calendarId, rule.all_day), []).append(rule)
+        self._candidates = {}
+
+    def candidates(self, calendarId, all_day):
+        """The rules that can apply to the events of a kind in a calendar, in order, merged once."""
+        key = (calendarId, all_day)
+        if key not in self._candidates:
+            rules = {}
+            for bucket in ((calendarId, all_day), (calendarId, None), (None, all_day), (None, None)):
+                for rule in self.buckets.get(bucket, ()):
+                    rules[rule.order] = rule
+            self._candidates[key] = [rules[order] for order in sorted(rules)]
+        return self._candidates[key]
+
+    def match(self, calendarId, event):
+        """Return the first rule matching an event, or None."""
+        for rule in self.candidates(calendarId, 'date' in event['start']):
+            if rule.matches(event):
+                return rule
+        return None
+
+    def reminders_for(self, calendarId, event):
+        """Return the reminders to set on an event, or None if it already has them or no rule asks for any."""
+        rule = self.match(calendarId, event)
+        if rule is None or rule.reminders is None:
+            return None
+        use_default, overrides = reminders_key(event.get('reminders'))
+        if use_default == rule.key[0] and rule.key[1] <= overrides:
+            return None
+        return rule.reminders
+
+
+# E N D   O F   F I L E #######################################################
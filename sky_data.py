@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Offline cache of the skyfield data files used by iss_visible.py.
+
+- The TLE file is kept in data_directory and only downloaded again once it is older than
+  tle_max_age_days. If the download fails, the cached copy is used even when stale.
+- Instead of the full de440.bsp (over 100 MB) the sun and earth positions come from a small
+  excerpt of de421.bsp that only holds the needed bodies over the next excerpt_days. The excerpt
+  is cut from the remote file with HTTP range requests, or from a local copy if there is one.
+  SPICE kernels are memory-mapped by jplephem.
+
+Once the files are cached, no network access is needed.
+
+Requires:
+pip3 install skyfield
+
+Source: https://github.com/Christophe-Gauge/Google-Calendar
+'''
+
+# I M P O R T S ###############################################################
+
+import os
+import os.path
+import time
+from skyfield.api import Loader
+from jplephem.daf import DAF
+from jplephem.spk import SPK
+from jplephem.excerpter import RemoteFile, write_excerpt
+
+
+__author__ = "Christophe Gauge"
+__version__ = "1.0.1"
+__license__ = "GNU General Public License v3.0"
+
+
+# G L O B A L S ###############################################################
+
+data_directory = 'skyfield-data'
+
+stations_url = 'https://celestrak.org/NORAD/elements/gp.php?GROUP=stations&FORMAT=tle'
+stations_file = 'stations.txt'
+tle_max_age_days = 1.0  # TLEs of the ISS drift quickly, refresh them daily
+
+ephemeris_file = 'de421.bsp'  # 17 MB, covers 1900-2050. Set use_excerpt to False to load it whole
+use_excerpt = True
+excerpt_file = 'sun_earth_excerpt.bsp'
+excerpt_targets = (10, 3, 399, 5, 6)  # Sun, Earth-Moon barycenter, Earth, and Jupiter and Saturn for light deflection
+excerpt_days = 400  # Days covered by the excerpt, starting a few days ago
+
+_loader = None
+
+
+# F U N C T I O N S ###########################################################
+
+
+def get_loader():
+    """Return the skyfield Loader working in data_directory."""
+    global _loader
+    if _loader is None:
+        os.makedirs(data_directory, exist_ok=True)
+        _loader = Loader(data_directory, verbose=False)
+    return _loader
+
+
+def julian_date(unix_time):
+    return 2440587.5 + unix_time / 86400.0
+
+
+def is_stale(filename, max_age_days):
+    """True if the file in data_directory is missing or older than max_age_days."""
+    path = get_loader().path_to(filename)
+    return not os.path.exists(path) or (time.time() - os.path.getmtime(path)) / 86400.0 > max_age_days
+
+
+def load_satellites(max_age_days=None):
+    """Return the satellites of the stations TLE file, downloading it only when stale."""
+    loader = get_loader()
+    if is_stale(stations_file, tle_max_age_days if max_age_days is None else max_age_days):
+        try:
+            loader.download(stations_url, filename=stations_file)
+        except Exception as e:
+            if not os.path.exists(loader.path_to(stations_file)):
+                raise
+            print(f'Could not refresh {stations_file} ({e}), using the cached copy')
+    return loader.tle_file(stations_file)
+
+
+def covers(filename, start_jd, end_jd):
+    """True if the SPICE kernel has all excerpt_targets, each covering [start_jd, end_jd]."""
+    with open(filename, 'rb') as f:
+        spk = SPK(DAF(f))
+        return set(excerpt_targets) <= set(segment.target for segment in spk.segments) and \
+            all(segment.start_jd <= start_jd and segment.end_jd >= end_jd for segment in spk.segments)
+
+
+def make_excerpt(start_jd, end_jd):
+    """Write excerpt_file with only the excerpt_targets segments of ephemeris_file."""
+    loader = get_loader()
+    source = loader.path_to(ephemeris_file)
+    f = open(source, 'rb') if os.path.exists(source) else RemoteFile(loader.build_url(ephemeris_file))
+    with f:
+        spk = SPK(DAF(f))
+        summaries = [summary for summary, segment in zip(spk.daf.summaries(), spk.segments)
+                     if segment.target in excerpt_targets]
+        tmp_file = loader.path_to(excerpt_file + '.tmp')
+        with open(tmp_file, 'w+b') as output:
+            write_excerpt(spk, output, start_jd, end_jd, summaries)
+    os.replace(tmp_file, loader.path_to(excerpt_file))
+
+
+def load_ephemeris(days=None):
+    """Return the ephemeris covering the next days (excerpt_days by default)."""
+    loader = get_loader()
+    if not use_excerpt:
+        return loader(ephemeris_file)
+
+    now = time.time()
+    needed_start, needed_end = julian_date(now) - 1, julian_date(now) + (days or excerpt_days)
+    path = loader.path_to(excerpt_file)
+    if not os.path.exists(path) or not covers(path, needed_start, needed_end):
+        try:
+            make_excerpt(needed_start - 2, max(needed_end, julian_date(now) + excerpt_days))
+        except Exception as e:
+            if not os.path.exists(path):
+                raise
+            print(f'Could not refresh {excerpt_file} ({e}), using the cached copy')
+    return loader(excerpt_file)
+
+
+def load_timescale():
+    """Return a timescale built from the data shipped with skyfield, no download needed."""
+    return get_loader().timescale(builtin=True)
+
+
+# E N D   O F   F I L E #######################################################
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Precomputed table of sunrise, sunset and twilight transitions for a location.
+
+The transitions between day, civil, nautical and astronomical twilight and night are computed
+for the whole horizon in a single skyfield almanac search and cached on disk, keyed by location
+and date range, so that later runs and other observers at the same place reuse them.
+Whether it is dark enough at a given time is then answered with a binary search.
+
+Requires:
+pip3 install skyfield
+
+Source: https://github.com/Christophe-Gauge/Google-Calendar
+'''
+
+# I M P O R T S ###############################################################
+
+import json
+import math
+import os
+import os.path
+import re
+import numpy as np
+from skyfield import almanac
+import metrics
+
+
+__author__ = "Christophe Gauge"
+__version__ = "1.0.1"
+__license__ = "GNU General Public License v3.0"
+
+
+# G L O B A L S ###############################################################
+
+cache_directory = os.path.join('skyfield-data', 'sun-events')
+
+# States returned by almanac.dark_twilight_day()
+NIGHT, ASTRONOMICAL_TWILIGHT, NAUTICAL_TWILIGHT, CIVIL_TWILIGHT, DAY = 0, 1, 2, 3, 4
+
+
+# F U N C T I O N S ###########################################################
+
+
+class SunTable(object):
+    """Sun state transitions of one location, as TT Julian dates."""
+
+    def __init__(self, start, end, initial, times, states):
+        self.start = start
+        self.end = end
+        self.initial = initial
+        self.times = np.asarray(times, dtype=float)
+        self.states = np.asarray(states, dtype=int)
+
+    def covers(self, start, end):
+        return self.start <= start and self.end >= end
+
+    def state_at(self, t):
+        """Sun state (NIGHT ... DAY) at each time of the skyfield Time t."""
+        index = np.searchsorted(self.times, t.tt, side='right')
+        states = np.concatenate(([self.initial], self.states))
+        return states[index]
+
+    def is_dark(self, t, darkest_allowed=CIVIL_TWILIGHT):
+        """True where the sun is set, or darker than darkest_allowed, at the times of t."""
+        return self.state_at(t) <= darkest_allowed
+
+    def sunsets(self, ts):
+        """Return the sunset times (transitions from DAY) as a skyfield Time."""
+        previous = np.concatenate(([self.initial], self.states[:-1]))
+        return ts.tt_jd(self.times[(previous == DAY) & (self.states != DAY)])
+
+    def to_dict(self):
+        return {'start': self.start, 'end': self.end, 'initial': int(self.initial),
+                'times': self.times.tolist(), 'states': self.states.tolist()}
+
+
+def cache_file(location_key):
+    """Cache file name of a location, location_key being e.g. (lat, lon, elevation)."""
+    name = re.sub(r'[^0-9A-Za-z.-]+', '_', '_'.join(str(part) for part in location_key))
+    return os.path.join(cache_directory, f'sun_{name}.json')
+
+
+def compute(ephemeris, ts, topos, start, end):
+    """Compute the SunTable of topos between the TT Julian dates start and end."""
+    f = almanac.dark_twilight_day(ephemeris, topos)
+    t0, t1 = ts.tt_jd(start), ts.tt_jd(end)
+    with metrics.timer('compute.almanac'):
+        t, states = almanac.find_discrete(t0, t1, f)
+    return SunTable(start, end, int(f(t0)), t.tt, states)
+
+
+def get_sun_table(ephemeris, ts, topos, location_key, t0, t1):
+    """Return a SunTable covering [t0, t1] for topos, from the disk cache when possible."""
+    filename = cache_file(location_key)
+    if os.path.exists(filename):
+        with open(filename) as f:
+            table = SunTable(**json.load(f))
+        if table.covers(t0.tt, t1.tt):
+            return table
+
+    # Whole days, so that runs started at different times of the same day reuse the cache
+    table = compute(ephemeris, ts, topos, math.floor(t0.tt - 0.5) + 0.5, math.ceil(t1.tt - 0.5) + 1.5)
+    os.makedirs(cache_directory, exist_ok=True)
+    tmp_file = filename + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(table.to_dict(), f)
+    os.replace(tmp_file, filename)
+    return table
+
+
+# E N D   O F   F I L E #######################################################